@@ -1,9 +1,13 @@
 # APP.py
 # -*- coding: utf-8 -*-
-import io, os, json, time, tempfile, unicodedata, re
+import io, os, json, time, tempfile, shutil, unicodedata, re, copy, threading, base64, hashlib, uuid, random
+import bisect, csv, math, subprocess, zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from urllib.parse import urlsplit, urlunsplit, quote, urlparse, parse_qs
+from urllib.parse import urlsplit, urlunsplit, quote, urlparse, parse_qs, urljoin
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # ================== CONFIG BÁSICA ==================
 st.set_page_config(page_title="Química Orgánica", page_icon="🧪", layout="wide")
@@ -30,7 +34,8 @@ TEMAS_BASE = [
 TEMAS_ESPECIALES = ["Heteroátomos","PAHs","Carbohidratos","Aminoácidos","Lípidos y proteínas"]
 
 # ===== Límites de carga (ajusta si lo necesitás) =====
-MAX_UPLOAD_MB = 50  # tope “seguro”; para videos grandes usa enlaces externos
+# Con la subida por bloques (TUS) el tope lo pone el plan de Supabase, no la RAM.
+MAX_UPLOAD_MB = int(st.secrets.get("MAX_UPLOAD_MB", 50))  # plan free: 50 MB por archivo
 def too_big(uploaded_file) -> bool:
     return getattr(uploaded_file, "size", 0) > MAX_UPLOAD_MB * 1024 * 1024
 
@@ -38,8 +43,12 @@ def human_mb(nbytes: int) -> str:
     return f"{nbytes/1024/1024:.1f} MB"
 
 # === Secrets (NO van en el repo; cargalas en Streamlit Secrets) ===
-SUPABASE_URL    = st.secrets["SUPABASE_URL"]
-SUPABASE_KEY    = st.secrets["SUPABASE_KEY"]          # service_role
+# STORAGE_BACKEND: "supabase" (producción) o "memory"/"local" (storage_local.py,
+# para benchmarks y pruebas sin red; ahí SUPABASE_URL/KEY son opcionales)
+STORAGE_BACKEND = st.secrets.get("STORAGE_BACKEND", "supabase")
+_LOCAL_BACKEND  = STORAGE_BACKEND in ("memory", "local")
+SUPABASE_URL    = st.secrets.get("SUPABASE_URL", "http://storage.local") if _LOCAL_BACKEND else st.secrets["SUPABASE_URL"]
+SUPABASE_KEY    = st.secrets.get("SUPABASE_KEY", "") if _LOCAL_BACKEND else st.secrets["SUPABASE_KEY"]  # service_role
 SUPABASE_BUCKET = st.secrets.get("SUPABASE_BUCKET", "utn")
 COURSE_ROOT     = st.secrets.get("COURSE_ROOT", "Quimica_Organica")
 PASSCODE        = st.secrets.get("PASSCODE", "FFCC")
@@ -78,35 +87,232 @@ div[role="tablist"] button { border-radius: 10px !important; }
 </style>
 """, unsafe_allow_html=True)
 
+# ================== CACHÉ (TTL) ==================
+# Listados y meta.json se guardan un rato en memoria del proceso
+# (compartido entre sesiones). Las escrituras invalidan solo las claves tocadas.
+# También guarda las URLs firmadas del bucket privado hasta poco antes de vencer.
+CACHE_TTL_S     = 60    # segundos de vida de cada entrada
+CACHE_MAX_ITEMS = 1024  # tope de entradas; se descarta la menos usada
+
+_MISS = object()
+
+@st.cache_resource
+def _cache_store() -> dict:
+    return {"lock": threading.Lock(), "items": OrderedDict(), "hits": 0, "misses": 0}
+
+def cache_get(key):
+    c = _cache_store()
+    with c["lock"]:
+        item = c["items"].get(key)
+        if item is None or item[0] < time.time():
+            if item is not None:
+                del c["items"][key]
+            c["misses"] += 1
+            return _MISS
+        c["items"].move_to_end(key)
+        c["hits"] += 1
+        return item[1]
+
+def cache_put(key, value, ttl: float = CACHE_TTL_S):
+    c = _cache_store()
+    with c["lock"]:
+        c["items"][key] = (time.time() + ttl, value)
+        c["items"].move_to_end(key)
+        while len(c["items"]) > CACHE_MAX_ITEMS:
+            c["items"].popitem(last=False)
+
+def cache_invalidate(*keys):
+    c = _cache_store()
+    with c["lock"]:
+        for k in keys:
+            c["items"].pop(k, None)
+
+def cache_invalidate_path(path: str):
+    """Invalida lo que depende de un objeto: el listado de su carpeta y su meta."""
+    parent = path.rsplit("/", 1)[0] if "/" in path else ""
+    cache_invalidate(("list", parent), ("meta", path))
+
+def cache_stats() -> dict:
+    c = _cache_store()
+    with c["lock"]:
+        total = c["hits"] + c["misses"]
+        return {"hits": c["hits"], "misses": c["misses"], "items": len(c["items"]),
+                "hit_rate": (c["hits"] / total) if total else 0.0}
+
+# ================== MÉTRICAS DE STORAGE ==================
+# Cada llamada a Storage pasa por storage_call(): se registra operación, ruta,
+# bytes, latencia y error. Los totales del rerun se muestran en el diagnóstico;
+# las últimas llamadas del proceso se exportan como JSON lines (y, si se define
+# METRICS_LOG en secrets, se agregan a ese archivo).
+METRICS_LOG    = st.secrets.get("METRICS_LOG", "")
+METRICS_RECENT = 5000  # llamadas que se guardan en memoria del proceso
+
+_rerun_calls: list = []  # llamadas de este rerun (el script se re-ejecuta entero)
+_rerun_t0 = time.perf_counter()
+
+@st.cache_resource
+def _metrics_store() -> dict:
+    return {"lock": threading.Lock(), "recent": deque(maxlen=METRICS_RECENT)}
+
+def record_call(op: str, path: str, nbytes: int, secs: float, error: str | None):
+    rec = {"ts": round(time.time(), 3), "op": op, "path": path, "bytes": nbytes,
+           "ms": round(secs * 1000, 1), "error": error}
+    _rerun_calls.append(rec)
+    m = _metrics_store()
+    with m["lock"]:
+        m["recent"].append(rec)
+        if METRICS_LOG:
+            try:
+                with open(METRICS_LOG, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+
+def storage_call(op: str, path: str, fn, *args, nbytes: int = 0, **kwargs):
+    t0 = time.perf_counter()
+    res, err = None, None
+    try:
+        res = fn(*args, **kwargs)
+        return res
+    except Exception as e:
+        err = repr(e)[:300]
+        raise
+    finally:
+        if isinstance(res, bytes):
+            nbytes = nbytes or len(res)
+        elif err is None and getattr(res, "status_code", 0) >= 400:  # httpx.Response (TUS)
+            err = f"HTTP {res.status_code}"
+        record_call(op, path, nbytes, time.perf_counter() - t0, err)
+
+def rerun_summary() -> list[dict]:
+    tot: dict[str, dict] = {}
+    for c in list(_rerun_calls):
+        t = tot.setdefault(c["op"], {"op": c["op"], "llamadas": 0, "ms": 0.0, "bytes": 0, "errores": 0})
+        t["llamadas"] += 1
+        t["ms"] = round(t["ms"] + c["ms"], 1)
+        t["bytes"] += c["bytes"]
+        t["errores"] += c["error"] is not None
+    return sorted(tot.values(), key=lambda t: -t["ms"])
+
+def metrics_jsonl() -> str:
+    m = _metrics_store()
+    with m["lock"]:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in m["recent"])
+
+# ================== E/S CONCURRENTE ==================
+# Pool acotado y compartido para lanzar en paralelo las llamadas a Storage.
+IO_WORKERS = 8
+
+@st.cache_resource
+def _io_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="storage-io")
+
+def submit_with_ctx(pool: ThreadPoolExecutor, fn, *args, **kwargs) -> Future:
+    ctx = get_script_run_ctx()
+    def _run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args, **kwargs)
+    return pool.submit(_run)
+
+def io_submit(fn, *args, **kwargs) -> Future:
+    return submit_with_ctx(_io_pool(), fn, *args, **kwargs)
+
+def io_map(fn, items) -> list:
+    """Como map(), pero en el pool; conserva el orden. No llamar desde un worker."""
+    return [f.result() for f in [io_submit(fn, it) for it in items]]
+
 # ================== SUPABASE CLIENT ==================
-from supabase import create_client, Client
-try:
-    from storage3.exceptions import StorageApiError
-except Exception:
-    class StorageApiError(Exception):
-        pass
-import storage3
+# La app solo usa Storage: el cliente de storage3 se arma directo (sin importar
+# supabase/postgrest/gotrue) una vez por proceso y lo comparten todas las
+# sesiones y reruns, con un pool httpx keep-alive (y HTTP/2 si está h2).
+import importlib.util
+import httpx
+
+HTTP_POOL_SIZE   = 20   # conexiones simultáneas a Storage por proceso
+HTTP_KEEPALIVE_S = 60
+HTTP_TIMEOUT_S   = 20
+HTTP2 = bool(st.secrets.get("STORAGE_HTTP2", True)) and importlib.util.find_spec("h2") is not None
 
-supa: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+@st.cache_resource
+def get_storage():
+    if _LOCAL_BACKEND:
+        from storage_local import LocalStorageClient
+        return LocalStorageClient(
+            f"{SUPABASE_URL.rstrip('/')}/storage/v1", bucket=SUPABASE_BUCKET,
+            root=st.secrets.get("STORAGE_LOCAL_DIR", ".storage_local") if STORAGE_BACKEND == "local" else None,
+            latency_ms=float(st.secrets.get("STORAGE_LATENCY_MS", 0)),
+            mbps=float(st.secrets.get("STORAGE_MBPS", 0)),
+        )
+    from storage3 import SyncStorageClient
+    from storage3.utils import SyncClient
 
-# ---------- Diagnóstico rápido ----------
-with st.expander("🛠️ Diagnóstico Supabase", expanded=False):
-    st.write("Bucket configurado:", SUPABASE_BUCKET)
-    st.write("URL:", SUPABASE_URL)
+    class PooledStorageClient(SyncStorageClient):
+        def _create_session(self, base_url, headers, timeout, verify=True):
+            return SyncClient(
+                base_url=base_url, headers=headers, timeout=timeout, verify=bool(verify),
+                follow_redirects=True, http2=HTTP2,
+                limits=httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                                    max_keepalive_connections=HTTP_POOL_SIZE,
+                                    keepalive_expiry=HTTP_KEEPALIVE_S),
+            )
+
+    return PooledStorageClient(
+        f"{SUPABASE_URL.rstrip('/')}/storage/v1",
+        {"apiKey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        HTTP_TIMEOUT_S,
+    )
+
+def _bucket():
+    return get_storage().from_(SUPABASE_BUCKET)
+
+# ---------- Diagnóstico (solo modo edición, a pedido) ----------
+# El chequeo de salud hace llamadas de administración (list_buckets, listar la
+# raíz): no corre en cada carga sino con el botón, y su resultado se reutiliza
+# HEALTH_TTL_S segundos para todas las sesiones.
+HEALTH_TTL_S = 300
+
+def health_check() -> dict:
+    res = {"ts": time.time()}
     try:
-        buckets = supa.storage.list_buckets()
-        st.success(f"Buckets visibles: {[b['name'] for b in buckets]}")
+        buckets = storage_call("list_buckets", "", get_storage().list_buckets)
+        res["buckets"] = [getattr(b, "name", None) or b["name"] for b in buckets]
     except Exception as e:
-        st.error("No pude listar buckets (¿SUPABASE_KEY no es service_role?).")
-        st.code(repr(e))
+        res["buckets_error"] = repr(e)
     try:
-        root_list = supa.storage.from_(SUPABASE_BUCKET).list("")
-        st.write(f"Objetos en raíz del bucket '{SUPABASE_BUCKET}': {len(root_list)}")
+        res["root_count"] = len(storage_call("list", "", _bucket().list, ""))
     except Exception as e:
-        st.error("Error listando raíz del bucket (¿nombre mal escrito o bucket inexistente?).")
-        st.code(repr(e))
-    import storage3 as _s3, supabase as _sb
-    st.caption(f"supabase-py: {getattr(_sb, '__version__', 'unknown')} | storage3: {getattr(_s3, '__version__', 'unknown')}")
+        res["root_error"] = repr(e)
+    cache_put(("health",), res, HEALTH_TTL_S)
+    return res
+
+diag = None
+if st.session_state.get("can_edit"):
+    diag = st.expander("🛠️ Diagnóstico Supabase", expanded=False)
+    with diag:
+        st.write("Bucket configurado:", SUPABASE_BUCKET)
+        st.write("URL:", SUPABASE_URL)
+        health = health_check() if st.button("Ejecutar chequeo de conexión") else cache_get(("health",))
+        if health is _MISS:
+            st.caption(f"Sin chequeo reciente (el resultado se guarda {HEALTH_TTL_S // 60} min).")
+        else:
+            st.caption(f"Chequeo de hace {time.time() - health['ts']:.0f} s.")
+            if "buckets" in health:
+                st.success(f"Buckets visibles: {health['buckets']}")
+            else:
+                st.error("No pude listar buckets (¿SUPABASE_KEY no es service_role?).")
+                st.code(health["buckets_error"])
+            if "root_count" in health:
+                st.write(f"Objetos en raíz del bucket '{SUPABASE_BUCKET}': {health['root_count']}")
+            else:
+                st.error("Error listando raíz del bucket (¿nombre mal escrito o bucket inexistente?).")
+                st.code(health["root_error"])
+        import storage3 as _s3
+        st.caption(f"storage3: {getattr(_s3, '__version__', 'unknown')} | httpx: {httpx.__version__} | "
+                   f"HTTP/2: {'sí' if HTTP2 else 'no'} | pool: {HTTP_POOL_SIZE} | backend: {STORAGE_BACKEND}")
+        cs = cache_stats()
+        st.caption(f"Caché: {cs['hits']} aciertos / {cs['misses']} fallos "
+                   f"({cs['hit_rate']:.0%}) | {cs['items']} entradas | TTL {CACHE_TTL_S}s")
 
 # ================== HELPERS ==================
 def safe_folder(name: str) -> str:
@@ -131,11 +337,30 @@ def _encode_url(u: str) -> str:
     path = quote(parts.path)
     return urlunsplit((parts.scheme, parts.netloc, path, parts.query, parts.fragment))
 
+LIST_PAGE = 100  # objetos por página al listar (el default del SDK trunca carpetas grandes)
+
 def storage_list(folder_path: str):
+    """Lista la carpeta completa, paginando por nombre."""
+    key = ("list", folder_path)
+    hit = cache_get(key)
+    if hit is not _MISS:
+        return hit
+    res, offset = [], 0
     try:
-        return supa.storage.from_(SUPABASE_BUCKET).list(folder_path) or []
-    except Exception:
-        return []
+        while True:
+            page = storage_call("list", folder_path, _bucket().list, folder_path, {
+                "limit": LIST_PAGE, "offset": offset,
+                "sortBy": {"column": "name", "order": "asc"},
+            }) or []
+            res.extend(page)
+            if len(page) < LIST_PAGE:
+                break
+            offset += LIST_PAGE
+    except Exception as e:
+        # un listado vacío por error se confundiría con una carpeta vacía
+        raise StorageReadError(f"{folder_path}: {e!r}") from e
+    cache_put(key, res)
+    return res
 
 def should_embed(url: str) -> bool:
     host = urlparse(url).netloc.lower()
@@ -159,7 +384,7 @@ def drive_preview_url(url: str) -> str:
         return f"https://drive.google.com/file/d/{file_id}/preview"
     return url
 
-def storage_upload(dst_path: str, data_bytes: bytes, content_type: str):
+def storage_upload(dst_path: str, data_bytes: bytes, content_type: str, quiet: bool = False):
     dst_path = re.sub(r"[^\w\-/\.]", "_", dst_path)
     with tempfile.NamedTemporaryFile(delete=False) as tmp:
         tmp.write(data_bytes)
@@ -167,26 +392,34 @@ def storage_upload(dst_path: str, data_bytes: bytes, content_type: str):
         tmp_path = tmp.name
     try:
         try:
-            return supa.storage.from_(SUPABASE_BUCKET).upload(
+            return storage_call(
+                "upload", dst_path, _bucket().upload,
                 dst_path,
                 tmp_path,
                 {"content-type": str(content_type), "cache-control": "3600", "x-upsert": "true"},
+                nbytes=len(data_bytes),
             )
-        except (StorageApiError, storage3.utils.StorageException, Exception) as e:
+        except Exception as e:
             try:
                 info = (e.args or [{}])[0]
                 status = info.get("statusCode")
                 msg = info.get("message") or info.get("error") or info
-                st.warning(f"Upload falló (status={status}). Intento update(). Detalle: {msg}")
+                if not quiet:
+                    st.warning(f"Upload falló (status={status}). Intento update(). Detalle: {msg}")
             except Exception:
-                st.warning(f"Upload falló. Intento update(). Detalle: {repr(e)}")
+                if not quiet:
+                    st.warning(f"Upload falló. Intento update(). Detalle: {repr(e)}")
             try:
-                return supa.storage.from_(SUPABASE_BUCKET).update(
+                return storage_call(
+                    "update", dst_path, _bucket().update,
                     dst_path,
                     tmp_path,
                     {"content-type": str(content_type), "cache-control": "3600"},
+                    nbytes=len(data_bytes),
                 )
-            except (StorageApiError, storage3.utils.StorageException, Exception) as e2:
+            except Exception as e2:
+                if quiet:
+                    raise
                 try:
                     info2 = (e2.args or [{}])[0]
                     status2 = info2.get("statusCode")
@@ -198,46 +431,404 @@ def storage_upload(dst_path: str, data_bytes: bytes, content_type: str):
                     st.code(repr(e2))
                 raise
     finally:
+        cache_invalidate_path(dst_path)
         try:
             os.remove(tmp_path)
         except Exception:
             pass
 
-def storage_download(src_path: str) -> bytes | None:
+# ---------- Subidas reanudables (protocolo TUS) ----------
+# Archivos grandes: se leen del UploadedFile en bloques y se envían con TUS, sin
+# copiar todo a bytes + tempfile. Si un bloque falla se pregunta al servidor el
+# offset recibido y se reintenta; si falla la subida entera, el siguiente intento
+# (misma carpeta/nombre/tamaño) retoma donde quedó.
+TUS_ENDPOINT = st.secrets.get("TUS_ENDPOINT", f"{SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable")
+TUS_CHUNK_MB = 6   # Supabase exige bloques de 6 MB (salvo el último)
+TUS_RETRIES  = 5   # reintentos seguidos por bloque
+
+@st.cache_resource
+def _tus_resumes() -> dict:
+    """resume_key -> {"url": ..., "dst": ...} de subidas a medio terminar."""
+    return {}
+
+def _tus_headers(**extra) -> dict:
+    return {"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY,
+            "Tus-Resumable": "1.0.0", **extra}
+
+def _tus_create(client: httpx.Client, dst_path: str, size: int, content_type: str) -> str:
+    meta = {"bucketName": SUPABASE_BUCKET, "objectName": dst_path,
+            "contentType": content_type, "cacheControl": "3600"}
+    enc = ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in meta.items())
+    r = storage_call("tus_create", dst_path, client.post, TUS_ENDPOINT, headers=_tus_headers(**{
+        "Upload-Length": str(size), "Upload-Metadata": enc, "x-upsert": "true"}))
+    r.raise_for_status()
+    return urljoin(TUS_ENDPOINT + "/", r.headers["Location"])
+
+def _tus_offset(client: httpx.Client, upload_url: str) -> int:
+    r = storage_call("tus_head", upload_url, client.head, upload_url, headers=_tus_headers())
+    r.raise_for_status()
+    return int(r.headers["Upload-Offset"])
+
+def _tus_retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.TransportError):
+        return True
+    return isinstance(e, httpx.HTTPStatusError) and (
+        e.response.status_code >= 500 or e.response.status_code in (409, 423))
+
+def storage_upload_stream(dst_path: str, fileobj, size: int, content_type: str,
+                          progress=None, resume_key: str | None = None) -> str:
+    """
+    Sube fileobj por bloques con TUS. Devuelve la ruta final (si se retoma una
+    subida previa es la de esa subida). progress(done, total) se llama por bloque.
+    """
+    dst_path = re.sub(r"[^\w\-/\.]", "_", dst_path)
+    resumes = _tus_resumes()
+    prev = resumes.get(resume_key) if resume_key else None
+    chunk = TUS_CHUNK_MB * 1024 * 1024
+    # El backend local atiende TUS en su propio transporte; con Supabase es None (red)
+    with httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0),
+                      transport=getattr(get_storage(), "transport", None)) as client:
+        offset, upload_url = 0, None
+        if prev:
+            try:
+                offset, upload_url = _tus_offset(client, prev["url"]), prev["url"]
+                dst_path = prev["dst"]
+            except httpx.HTTPError:
+                resumes.pop(resume_key, None)
+        try:
+            if upload_url is None:
+                upload_url = _tus_create(client, dst_path, size, content_type)
+                if resume_key:
+                    resumes[resume_key] = {"url": upload_url, "dst": dst_path}
+            fails = 0
+            while offset < size:
+                fileobj.seek(offset)
+                data = fileobj.read(chunk)
+                try:
+                    r = storage_call("tus_patch", dst_path, client.patch, upload_url, content=data,
+                                     nbytes=len(data), headers=_tus_headers(**{
+                        "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}))
+                    r.raise_for_status()
+                    offset = int(r.headers.get("Upload-Offset", offset + len(data)))
+                    fails = 0
+                except httpx.HTTPError as e:
+                    fails += 1
+                    if not _tus_retryable(e) or fails > TUS_RETRIES:
+                        raise
+                    time.sleep(min(0.5 * 2 ** fails, 15))
+                    try:
+                        offset = _tus_offset(client, upload_url)
+                    except httpx.HTTPError:
+                        pass
+                if progress:
+                    progress(offset, size)
+            if resume_key:
+                resumes.pop(resume_key, None)
+        finally:
+            cache_invalidate_path(dst_path)
+    return dst_path
+
+# ---------- Caché en disco (read-through, LRU) ----------
+# Cada objeto descargado queda en disco con su ETag/Last-Modified. Si quien pide
+# conoce la versión (mtime/tamaño/hash del manifiesto) y coincide, no hay red; si
+# no, se revalida con If-None-Match/If-Modified-Since (304 = sin cuerpo). Se
+# descarta lo menos usado al superar DISK_CACHE_MB.
+# Con SERVE_HOT_FILES los PDF ya cacheados se sirven desde la app misma vía
+# static/ (requiere `server.enableStaticServing = true` en .streamlit/config.toml).
+# Solo los PDF van a HOT_DIR; el índice y el resto de los objetos (meta.json,
+# manifest.json, search.json, videos, audios) quedan en DISK_CACHE_DIR, fuera de
+# lo que se sirve. Con bucket privado no se sirve nada: saltearía las URLs firmadas.
+DISK_CACHE_MB   = int(st.secrets.get("DISK_CACHE_MB", 500))
+SERVE_HOT_FILES = bool(st.secrets.get("SERVE_HOT_FILES", False)) and not bool(st.secrets.get("PRIVATE_BUCKET", False))
+APP_DIR         = Path(__file__).resolve().parent
+HOT_DIR         = APP_DIR / "static" / "cache"
+DISK_CACHE_DIR  = Path(st.secrets.get("DISK_CACHE_DIR", Path(tempfile.gettempdir()) / "quimica_organica_cache"))
+
+def _disk_file(fname: str) -> Path:
+    """Ubicación de un archivo del caché: los PDF en HOT_DIR si se sirven, el resto en DISK_CACHE_DIR."""
+    if SERVE_HOT_FILES and fname.endswith(".pdf"):
+        return HOT_DIR / fname
+    return DISK_CACHE_DIR / fname
+
+@st.cache_resource
+def _disk_index() -> dict:
+    DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    if SERVE_HOT_FILES:
+        HOT_DIR.mkdir(parents=True, exist_ok=True)
+    entries = OrderedDict()
     try:
-        return supa.storage.from_(SUPABASE_BUCKET).download(src_path)
-    except Exception:
+        saved = json.loads((DISK_CACHE_DIR / "index.json").read_text("utf-8"))
+        for path, e in sorted(saved.items(), key=lambda kv: kv[1].get("atime", 0)):
+            if _disk_file(e["file"]).exists():
+                entries[path] = e
+    except (OSError, ValueError):
+        pass
+    return {"lock": threading.Lock(), "entries": entries, "inflight": set()}
+
+def _disk_commit(idx: dict):
+    """Aplica el tope LRU y persiste el índice. Llamar con idx["lock"] tomado."""
+    limit = DISK_CACHE_MB * 1024 * 1024
+    total = sum(e.get("size", 0) for e in idx["entries"].values())
+    while total > limit and idx["entries"]:
+        _, old = idx["entries"].popitem(last=False)
+        total -= old.get("size", 0)
+        _disk_file(old["file"]).unlink(missing_ok=True)
+    tmp = DISK_CACHE_DIR / "index.json.tmp"
+    tmp.write_text(json.dumps(idx["entries"]), "utf-8")
+    tmp.replace(DISK_CACHE_DIR / "index.json")
+
+def _get_object_to_file(path: str, headers: dict, dst: Path) -> tuple[int, dict, int]:
+    """GET autenticado del objeto, escrito en streaming a dst. Devuelve (status, headers, bytes)."""
+    with get_storage().session.stream("GET", f"object/{SUPABASE_BUCKET}/{path}", headers=headers) as r:
+        if r.status_code != 200:
+            return r.status_code, dict(r.headers), 0
+        n = 0
+        with open(dst, "wb") as fh:
+            for block in r.iter_bytes(1 << 16):
+                fh.write(block)
+                n += len(block)
+        return 200, dict(r.headers), n
+
+def disk_cache_peek(path: str, version: str) -> Path | None:
+    """Copia local vigente para esa versión, sin red."""
+    idx = _disk_index()
+    with idx["lock"]:
+        e = idx["entries"].get(path)
+        if e and version and e.get("version") == version and _disk_file(e["file"]).exists():
+            idx["entries"].move_to_end(path)
+            e["atime"] = time.time()
+            return _disk_file(e["file"])
+    return None
+
+class StorageReadError(Exception):
+    """Storage no respondió (red, 5xx): distinto de un 404, no es un archivo vacío."""
+
+def disk_cache_fetch(path: str, version: str = "", strict: bool = False) -> Path | None:
+    """
+    Copia local al día del objeto, o None solo si no existe (404). Si Storage
+    falla se sirve la copia vieja; sin copia, o con strict=True (lecturas para
+    reescribir meta.json/search.json), levanta StorageReadError.
+    """
+    local = disk_cache_peek(path, version)
+    if local is not None:
+        return local
+    idx = _disk_index()
+    with idx["lock"]:
+        e = copy.deepcopy(idx["entries"].get(path))
+    headers = {}
+    if e and e.get("etag"):
+        headers["If-None-Match"] = e["etag"]
+    if e and e.get("lm"):
+        headers["If-Modified-Since"] = e["lm"]
+    fname = hashlib.sha1(path.encode("utf-8")).hexdigest() + Path(path).suffix.lower()
+    tmp = _disk_file(fname).with_name(f"{fname}.{uuid.uuid4().hex}.part")
+    t0, err, status, size = time.perf_counter(), None, 0, 0
+    try:
+        status, rh, size = _get_object_to_file(path, headers, tmp)
+    except Exception as ex:
+        err = repr(ex)[:300]
+    finally:
+        record_call("revalidate" if headers else "download", path, size, time.perf_counter() - t0,
+                    err or (f"HTTP {status}" if status not in (200, 304) else None))
+    if status == 304 and e and not _disk_file(e["file"]).exists():
+        # la copia local desapareció (p. ej. limpieza de /tmp): se pide el objeto entero
+        tmp.unlink(missing_ok=True)
+        disk_cache_drop(path)
+        return disk_cache_fetch(path, version, strict)
+    if status not in (200, 304) or (status == 304 and not e):
+        tmp.unlink(missing_ok=True)
+        if status == 404:
+            disk_cache_drop(path)
+            return None
+        if strict or not e:
+            raise StorageReadError(f"{path}: {err or f'HTTP {status}'}")
+        return _disk_file(e["file"])  # sin red: sirve la copia local
+    if status == 200:
+        tmp.replace(_disk_file(fname))
+        e = {"file": fname, "etag": rh.get("etag"), "lm": rh.get("last-modified"), "size": size}
+    else:
+        tmp.unlink(missing_ok=True)
+    e.update(version=version, atime=time.time())
+    with idx["lock"]:
+        idx["entries"][path] = e
+        idx["entries"].move_to_end(path)
+        _disk_commit(idx)
+    return _disk_file(fname)
+
+def disk_cache_prefetch(path: str, version: str):
+    """Baja el objeto en segundo plano (una sola vez aunque lo pidan varias sesiones)."""
+    idx = _disk_index()
+    with idx["lock"]:
+        if path in idx["inflight"]:
+            return
+        idx["inflight"].add(path)
+    def _run():
+        try:
+            disk_cache_fetch(path, version)
+        finally:
+            with idx["lock"]:
+                idx["inflight"].discard(path)
+    io_submit(_run)
+
+def disk_cache_drop(path: str):
+    idx = _disk_index()
+    with idx["lock"]:
+        e = idx["entries"].pop(path, None)
+        if e:
+            _disk_file(e["file"]).unlink(missing_ok=True)
+            _disk_commit(idx)
+
+def storage_download(src_path: str, strict: bool = False) -> bytes | None:
+    """Contenido del objeto; None solo si no existe. Si no se pudo leer, StorageReadError."""
+    local = disk_cache_fetch(src_path, strict=strict)
+    if local is None:
         return None
+    try:
+        return local.read_bytes()
+    except OSError as e:
+        raise StorageReadError(f"{src_path}: {e!r}") from e
 
 def storage_remove(paths: list[str]):
     try:
-        return supa.storage.from_(SUPABASE_BUCKET).remove(paths)
+        return storage_call("remove", ",".join(paths), _bucket().remove, paths)
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        for p in paths:
+            cache_invalidate_path(p)
+            disk_cache_drop(p)
 
-def public_url(path: str) -> str | None:
-    try:
-        res = supa.storage.from_(SUPABASE_BUCKET).get_public_url(path)
-        if isinstance(res, dict):
-            return res.get("publicURL") or res.get("publicUrl") or res.get("data", {}).get("publicUrl")
-        return str(res)
-    except Exception:
-        return None
+def public_url(path: str) -> str:
+    """URL pública armada localmente, igual que get_public_url() pero sin E/S."""
+    return f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{SUPABASE_BUCKET}/{path.lstrip('/')}"
 
-def read_meta(tema: str) -> dict:
-    p = bucket_join(topic_prefix(tema), "meta.json")
-    raw = storage_download(p)
-    if not raw:
-        return {}
+# ---------- Bucket privado: URLs firmadas por lote ----------
+PRIVATE_BUCKET     = bool(st.secrets.get("PRIVATE_BUCKET", False))
+SIGNED_URL_TTL_S   = 3600  # validez pedida a Supabase
+SIGNED_URL_SLACK_S = 300   # se renuevan este margen antes de vencer
+
+def _signed_batch(paths: list[str]) -> dict:
     try:
-        return json.loads(raw.decode("utf-8"))
+        res = storage_call("create_signed_urls", paths[0].rsplit("/", 1)[0],
+                           _bucket().create_signed_urls, paths, SIGNED_URL_TTL_S)
     except Exception:
         return {}
+    out = {}
+    for p, item in zip(paths, res or []):
+        url = item.get("signedURL") or item.get("signedUrl")
+        if url and not item.get("error"):
+            out[item.get("path") or p] = url
+            cache_put(("signed", item.get("path") or p), url, SIGNED_URL_TTL_S - SIGNED_URL_SLACK_S)
+    return out
+
+def object_urls(paths: list[str]) -> dict:
+    """
+    path -> URL para mostrar. Bucket público: armado local. Bucket privado: URLs
+    firmadas desde caché, y las que falten se piden en una llamada por carpeta.
+    """
+    if not PRIVATE_BUCKET:
+        return {p: public_url(p) for p in paths}
+    out, by_folder = {}, {}
+    for p in paths:
+        hit = cache_get(("signed", p))
+        if hit is not _MISS:
+            out[p] = hit
+        else:
+            by_folder.setdefault(p.rsplit("/", 1)[0], []).append(p)
+    for urls in io_map(_signed_batch, list(by_folder.values())):
+        out.update(urls)
+    return out
+
+def read_meta(tema: str, strict: bool = False) -> dict:
+    """{} si el tema todavía no tiene meta.json; si Storage falla, StorageReadError (nunca {})."""
+    p = bucket_join(topic_prefix(tema), "meta.json")
+    hit = cache_get(("meta", p))
+    if hit is not _MISS:
+        return copy.deepcopy(hit)  # los llamadores mutan el dict antes de write_meta
+    raw = storage_download(p, strict=strict)
+    meta = {}
+    if raw:
+        try:
+            meta = json.loads(raw.decode("utf-8"))
+        except Exception:
+            meta = {}
+    cache_put(("meta", p), meta)
+    return copy.deepcopy(meta)
 
-def write_meta(tema: str, meta: dict):
+def write_meta(tema: str, meta: dict, quiet: bool = False):
     p = bucket_join(topic_prefix(tema), "meta.json")
     storage_upload(p, json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"),
-                   content_type="application/json")
+                   content_type="application/json", quiet=quiet)
+    cache_put(("meta", p), copy.deepcopy(meta))  # el editor ve su cambio al instante
+    manifest_sync_meta(tema, meta)
+
+# ---------- Escritura de meta.json: por lotes y con control de versión ----------
+# Las ediciones no escriben al instante: se encolan como funciones sobre el dict y
+# flush_meta() las aplica todas juntas (una escritura por tema y rerun) sobre la
+# última versión guardada. Storage no ofrece PUT condicional, así que cada
+# escritura lleva _version/_writer: justo antes de subir se relee y, si
+# _version cambió desde la base, se reaplican las ops sobre la versión nueva
+# (merge) y se reintenta; después de subir se relee para detectar la carrera
+# que queda entre esa comprobación y la escritura. Dentro del proceso (todas
+# las sesiones y los trabajos de subida) un lock por archivo serializa las
+# escrituras, así la comprobación solo tiene que cubrir a otros procesos.
+META_RETRIES = 4
+_meta_ops: list = []  # (tema, fn) de este rerun
+
+@st.cache_resource
+def _write_locks() -> dict:
+    return {"lock": threading.Lock(), "paths": {}}
+
+def _write_lock(path: str) -> threading.Lock:
+    reg = _write_locks()
+    with reg["lock"]:
+        return reg["paths"].setdefault(path, threading.Lock())
+
+def meta_op(tema: str, fn):
+    _meta_ops.append((tema, fn))
+
+def commit_versioned(kind: str, p: str, read, write, ops: list) -> dict:
+    """
+    Lectura-modificación-escritura de un JSON versionado (meta.json, search.json):
+    read() devuelve el dict guardado (vía el caché (kind, p)), write(d) lo sube.
+    read() tiene que leer en modo estricto: una copia vieja o un {} por un error
+    de red pasarían la comprobación de versión y pisarían el archivo.
+    """
+    with _write_lock(p):
+        token = uuid.uuid4().hex
+        for attempt in range(META_RETRIES):
+            cache_invalidate((kind, p))
+            base = read()
+            data = copy.deepcopy(base)
+            for fn in ops:
+                fn(data)
+            data["_version"] = int(base.get("_version", 0)) + 1
+            data["_writer"] = token
+            cache_invalidate((kind, p))
+            if read().get("_version") == base.get("_version"):
+                write(data)
+                cache_invalidate((kind, p))
+                if read().get("_writer") == token:
+                    return data
+            time.sleep(random.uniform(0.05, 0.25) * (attempt + 1))
+    raise RuntimeError(f"{p.rsplit('/', 1)[-1]} cambió {META_RETRIES} veces seguidas mientras se guardaba")
+
+def commit_meta(tema: str, ops: list, quiet: bool = False) -> dict:
+    """quiet=True desde los trabajos en segundo plano: sin avisos en la página, los errores suben."""
+    return commit_versioned("meta", bucket_join(topic_prefix(tema), "meta.json"),
+                            lambda: read_meta(tema, strict=True), lambda m: write_meta(tema, m, quiet=quiet), ops)
+
+def flush_meta():
+    """Escribe, una vez por tema, todas las ediciones encoladas en este rerun."""
+    pending: dict[str, list] = {}
+    for tema, fn in _meta_ops:
+        pending.setdefault(tema, []).append(fn)
+    _meta_ops.clear()
+    for tema, ops in pending.items():
+        try:
+            commit_meta(tema, ops)
+        except Exception as e:
+            st.error(f"No se pudieron guardar los cambios de «{tema}»: {e}. Reintentá.")
 
 def get_title(meta, bucket, filename):
     return meta.get("titles", {}).get(bucket, {}).get(filename, "")
@@ -249,15 +840,616 @@ def set_title(meta, bucket, filename, title):
     else:
         meta["titles"][bucket].pop(filename, None)
 
+def set_hash(meta, bucket, filename, digest):
+    meta.setdefault("hashes", {}).setdefault(bucket, {})[filename] = digest
+
+def set_ref(meta, bucket, filename, src, size):
+    """Registra un archivo que reutiliza un objeto ya subido en otro tema."""
+    meta.setdefault("refs", {}).setdefault(bucket, {})[filename] = {"src": src, "size": size}
+
+def set_media(meta, bucket, filename, info):
+    """Duración, resolución y bitrate de un video (ver mp4_probe)."""
+    if info:
+        meta.setdefault("media", {}).setdefault(bucket, {})[filename] = info
+
+def get_media(meta, bucket, filename):
+    return meta.get("media", {}).get(bucket, {}).get(filename)
+
+def forget_file(meta, bucket, filename):
+    set_title(meta, bucket, filename, "")
+    for k in ("hashes", "refs", "media"):
+        meta.get(k, {}).get(bucket, {}).pop(filename, None)
+
 def add_link(meta, titulo, url):
     meta.setdefault("video_links", []).append({"titulo": titulo.strip() or "Video", "url": url.strip()})
 
-def delete_link(meta, idx):
+def delete_link(meta, idx, item=None):
+    links = meta.setdefault("video_links", [])
+    if item is not None:  # por contenido: otro editor pudo haber cambiado los índices
+        idx = links.index(item) if item in links else None
     try:
-        meta.setdefault("video_links", []).pop(idx)
+        links.pop(idx)
     except Exception:
         pass
 
+# ================== MANIFIESTO DEL CURSO ==================
+# Un único JSON con todos los objetos de todos los temas (nombre, tamaño, mtime,
+# título y URL pública) más los enlaces de video. Se actualiza en cada
+# alta/baja/renombre; "Reconstruir índice" lo regenera leyendo Storage.
+BUCKETS        = ["resumenes", "apuntes", "videos", "audios"]
+MANIFEST_TTL_S = 300
+
+def manifest_path() -> str:
+    return bucket_join(COURSE_ROOT, "manifest.json")
+
+@st.cache_resource
+def _manifest_lock() -> threading.RLock:
+    # reentrante: read_manifest lo toma al armar el manifiesto y manifest_rebuild
+    # lo vuelve a tomar para guardarlo
+    return threading.RLock()
+
+def _now_iso() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+def _save_manifest(man: dict):
+    man["updated_at"] = _now_iso()
+    p = manifest_path()
+    storage_upload(p, json.dumps(man, ensure_ascii=False, indent=2).encode("utf-8"),
+                   content_type="application/json", quiet=True)
+    cache_put(("manifest", p), man, MANIFEST_TTL_S)
+
+def manifest_rebuild() -> dict:
+    """
+    Regenera el manifiesto completo listando Storage (reparación). Si falló algún
+    listado o meta.json no se guarda: el resultado incompleto solo se usa en
+    memoria hasta que vence el caché.
+    """
+    folders = {(t, b): bucket_join(topic_prefix(t), b) for t in TEMAS for b in BUCKETS}
+    for t in TEMAS:
+        cache_invalidate(("meta", bucket_join(topic_prefix(t), "meta.json")))
+    cache_invalidate(*(("list", f) for f in folders.values()))
+    failed = []
+    def _safe(fn, empty):
+        def _run(arg):
+            try:
+                return fn(arg)
+            except Exception as e:
+                failed.append(repr(e))
+                return empty
+        return _run
+    metas = dict(zip(TEMAS, io_map(_safe(lambda t: read_meta(t, strict=True), {}), TEMAS)))
+    listings = dict(zip(folders, io_map(_safe(storage_list, []), folders.values())))
+
+    found = [(t, b, obj) for (t, b), objs in listings.items() for obj in objs
+             if obj.get("name") and obj.get("id") is not None]  # sin subcarpetas
+    urls = [public_url(bucket_join(folders[(t, b)], obj["name"])) for t, b, obj in found]
+
+    man = {"version": 1, "temas": {
+        t: {"video_links": metas[t].get("video_links", []), "files": {b: {} for b in BUCKETS}}
+        for t in TEMAS
+    }}
+    for (t, b, obj), url in zip(found, urls):
+        md = obj.get("metadata") or {}
+        man["temas"][t]["files"][b][obj["name"]] = {
+            "size": md.get("size", 0),
+            "mtime": obj.get("updated_at") or obj.get("created_at") or "",
+            "title": get_title(metas[t], b, obj["name"]),
+            "url": url,
+            "sha256": metas[t].get("hashes", {}).get(b, {}).get(obj["name"], ""),
+        }
+    for t in TEMAS:
+        for b, refs in metas[t].get("refs", {}).items():
+            for name, ref in refs.items():
+                man["temas"][t]["files"].setdefault(b, {})[name] = {
+                    "size": ref.get("size", 0), "mtime": "",
+                    "title": get_title(metas[t], b, name),
+                    "url": public_url(ref["src"]), "src": ref["src"],
+                    "sha256": metas[t].get("hashes", {}).get(b, {}).get(name, ""),
+                }
+        for b, files in man["temas"][t]["files"].items():
+            for name, entry in files.items():
+                if get_media(metas[t], b, name):
+                    entry["media"] = get_media(metas[t], b, name)
+    with _manifest_lock():
+        try:
+            if failed:
+                man["incomplete"] = len(failed)  # marca solo en memoria: así no se guarda
+                raise StorageReadError(f"{len(failed)} lecturas fallidas: {failed[0]}")
+            _save_manifest(man)
+        except Exception:
+            # Storage caído: se usa lo que se pudo leer y se reintenta al vencer el caché
+            cache_put(("manifest", manifest_path()), man, CACHE_TTL_S)
+    return man
+
+def _load_manifest(strict: bool = False) -> dict | None:
+    """manifest.json tal como está en Storage; None si no existe (404) o no es válido."""
+    raw = storage_download(manifest_path(), strict=strict)
+    if raw is None:
+        return None
+    try:
+        man = json.loads(raw.decode("utf-8"))
+    except Exception:
+        return None
+    return man if isinstance(man, dict) and "temas" in man else None
+
+def read_manifest() -> dict:
+    """Devuelve el manifiesto (compartido: NO mutarlo; usar manifest_update)."""
+    p = manifest_path()
+    hit = cache_get(("manifest", p))
+    if hit is not _MISS:
+        return hit
+    # Caché frío: una sola sesión lo baja (o lo rearma); las demás esperan el lock
+    # y toman el resultado del caché en lugar de listar Storage cada una.
+    with _manifest_lock():
+        hit = cache_get(("manifest", p))
+        if hit is not _MISS:
+            return hit
+        man = _load_manifest()  # si Storage falla sin copia local, StorageReadError
+        if man is None:
+            return manifest_rebuild()
+        cache_put(("manifest", p), man, MANIFEST_TTL_S)
+        return man
+
+def manifest_topic(tema: str) -> dict:
+    return read_manifest().get("temas", {}).get(tema, {})
+
+def fetch_topic(tema: str, buckets: list[str] = BUCKETS) -> dict:
+    """
+    Etapa de carga de una página: trae el manifiesto y resuelve las URLs que hagan
+    falta (todas si el bucket es privado) solo de los buckets que se van a
+    mostrar; devuelve el tema listo para renderizar.
+    """
+    topic = copy.deepcopy(manifest_topic(tema))
+    shown = {b: files for b, files in topic.get("files", {}).items() if b in buckets}
+    paths = {(b, name): entry.get("src") or bucket_join(topic_prefix(tema), b, name)
+             for b, files in shown.items()
+             for name, entry in files.items() if PRIVATE_BUCKET or not entry.get("url")}
+    posters = {(b, name): entry["media"]["poster"]
+               for b, files in shown.items()
+               for name, entry in files.items() if (entry.get("media") or {}).get("poster")}
+    if paths or posters:
+        urls = object_urls(list(paths.values()) + list(posters.values()))
+        for (b, name), p in paths.items():
+            topic["files"][b][name]["url"] = urls.get(p)
+        for (b, name), p in posters.items():
+            topic["files"][b][name]["poster_url"] = urls.get(p)
+    return topic
+
+def _manifest_for_update() -> dict:
+    man = _load_manifest(strict=True)
+    return man if man is not None else read_manifest()  # no existe: se rearma primero
+
+def manifest_update(tema: str, fn):
+    """Modifica un tema del manifiesto con el mismo control de versión que meta.json."""
+    def _op(man):
+        fn(man.setdefault("temas", {}).setdefault(tema, {"video_links": [], "files": {}}))
+    commit_versioned("manifest", manifest_path(), _manifest_for_update, _save_manifest, [_op])
+
+def manifest_add_files(tema: str, bucket: str, items: list[tuple]):
+    """Agrega varios archivos con una sola escritura: items = [(nombre, tamaño, sha256, src)]."""
+    entries = {}
+    for name, size, sha256, src in items:
+        full_path = src or bucket_join(topic_prefix(tema), bucket, name)
+        entries[name] = {"size": size, "mtime": _now_iso(), "title": "", "url": public_url(full_path),
+                         "sha256": sha256}
+        if src:
+            entries[name]["src"] = src
+    manifest_update(tema, lambda t: t.setdefault("files", {}).setdefault(bucket, {}).update(entries))
+
+def manifest_add_file(tema: str, bucket: str, name: str, size: int, sha256: str = "", src: str = ""):
+    manifest_add_files(tema, bucket, [(name, size, sha256, src)])
+
+def manifest_remove_file(tema: str, bucket: str, name: str):
+    manifest_update(tema, lambda t: t.setdefault("files", {}).setdefault(bucket, {}).pop(name, None))
+
+def manifest_find_hash(digest: str, prefer: tuple[str, str] | None = None):
+    """
+    Busca un archivo ya subido con ese contenido: (tema, bucket, nombre, entrada)
+    o None. Con prefer=(tema, bucket) mira primero ahí, así una copia en ese
+    bucket gana a la que aparezca antes en otro tema.
+    """
+    if not digest:
+        return None
+    temas = read_manifest().get("temas", {})
+    if prefer:
+        t, b = prefer
+        for name, entry in temas.get(t, {}).get("files", {}).get(b, {}).items():
+            if entry.get("sha256") == digest:
+                return t, b, name, entry
+    for t, topic in temas.items():
+        for b, files in topic.get("files", {}).items():
+            for name, entry in files.items():
+                if entry.get("sha256") == digest:
+                    return t, b, name, entry
+    return None
+
+def manifest_object_in_use(path: str, exclude: tuple[str, str, str]) -> bool:
+    """True si alguna otra entrada del manifiesto (propia o ref) usa el objeto `path`."""
+    for t, topic in read_manifest().get("temas", {}).items():
+        for b, files in topic.get("files", {}).items():
+            for name, entry in files.items():
+                if (t, b, name) == exclude:
+                    continue
+                if (entry.get("src") or bucket_join(topic_prefix(t), b, name)) == path:
+                    return True
+    return False
+
+def manifest_sync_meta(tema: str, meta: dict):
+    """Copia títulos y enlaces de meta.json al manifiesto."""
+    def _sync(topic):
+        topic["video_links"] = meta.get("video_links", [])
+        for b, files in topic.setdefault("files", {}).items():
+            for name, entry in files.items():
+                entry["title"] = get_title(meta, b, name)
+                if get_media(meta, b, name):
+                    entry["media"] = get_media(meta, b, name)
+    manifest_update(tema, _sync)
+
+# ================== EXPORTACIÓN ZIP ==================
+# "Descargar todo" de un tema, de un bucket o del curso. El ZIP se arma en disco
+# copiando cada objeto por bloques (memoria constante) y queda cacheado con una
+# huella del contenido: mientras el manifiesto de esos temas no cambie, se reusa.
+# La descarga nunca pasa por la memoria del proceso: con SERVE_HOT_FILES la app
+# lo sirve como archivo estático; si no, se sube por bloques a Storage (exports/)
+# y se enlaza su URL pública o firmada.
+EXPORT_DIR  = (HOT_DIR if SERVE_HOT_FILES else DISK_CACHE_DIR) / "zips"
+EXPORT_KEEP = int(st.secrets.get("EXPORT_KEEP", 20))
+
+@st.cache_resource
+def _export_locks() -> dict:
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    return {"lock": threading.Lock(), "building": {}}
+
+def export_fingerprint(temas: list[str], bucket: str | None = None) -> str:
+    man = read_manifest().get("temas", {})
+    parts = []
+    for t in temas:
+        files = man.get(t, {}).get("files", {})
+        for b in ([bucket] if bucket else BUCKETS):
+            for name, e in sorted(files.get(b, {}).items()):
+                parts.append([t, b, name, e.get("size"), e.get("mtime"), e.get("sha256"), e.get("title")])
+        if not bucket:
+            parts.append([t, man.get(t, {}).get("video_links", [])])
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def export_path(scope: str, temas: list[str], bucket: str | None = None) -> Path:
+    return EXPORT_DIR / f"{safe_folder(scope)}_{export_fingerprint(temas, bucket)}.zip"
+
+def export_remote(dst: Path) -> str:
+    return bucket_join(COURSE_ROOT, "exports", dst.name)
+
+def _export_marker(dst: Path) -> Path:
+    """Marca local de que ese ZIP ya está en Storage."""
+    return dst.with_name(dst.name + ".up")
+
+def export_ready(dst: Path) -> bool:
+    return dst.exists() and (SERVE_HOT_FILES or _export_marker(dst).exists())
+
+def _publish_export(dst: Path):
+    size = dst.stat().st_size
+    with open(dst, "rb") as fh:
+        if size <= TUS_CHUNK_MB * 1024 * 1024:
+            storage_upload(export_remote(dst), fh.read(), content_type="application/zip", quiet=True)
+        else:
+            storage_upload_stream(export_remote(dst), fh, size, "application/zip")
+    _export_marker(dst).touch()
+
+def _copy_object_into(path: str, version: str, out) -> int:
+    """Copia el objeto a `out` por bloques: desde la caché de disco si está, si no desde Storage."""
+    local = disk_cache_peek(path, version)
+    if local is not None and local.exists():
+        with open(local, "rb") as fh:
+            shutil.copyfileobj(fh, out, 1 << 16)
+        return local.stat().st_size
+    t0, n, err = time.perf_counter(), 0, None
+    try:
+        with get_storage().session.stream("GET", f"object/{SUPABASE_BUCKET}/{path}") as r:
+            if r.status_code != 200:
+                raise RuntimeError(f"HTTP {r.status_code} al leer {path}")
+            for block in r.iter_bytes(1 << 16):
+                out.write(block)
+                n += len(block)
+        return n
+    except Exception as ex:
+        err = repr(ex)[:300]
+        raise
+    finally:
+        record_call("download", path, n, time.perf_counter() - t0, err)
+
+def _zip_arcname(t: str, b: str, name: str, entry: dict, used: set) -> str:
+    title = (entry.get("title") or "").strip()
+    base = safe_filename(title) + Path(name).suffix.lower() if title else name
+    arc, i = f"{t}/{b}/{base}", 1
+    while arc in used:
+        arc, i = f"{t}/{b}/{Path(base).stem}_{i}{Path(base).suffix}", i + 1
+    used.add(arc)
+    return arc
+
+def build_export(scope: str, temas: list[str], bucket: str | None = None) -> Path:
+    """Arma (o reusa) el ZIP de esos temas/bucket. Una sola construcción aunque lo pidan varias sesiones."""
+    dst = export_path(scope, temas, bucket)
+    reg = _export_locks()
+    with reg["lock"]:
+        lock = reg["building"].setdefault(dst.name, threading.Lock())
+    with lock:
+        if dst.exists():
+            os.utime(dst)
+            if not export_ready(dst):
+                _publish_export(dst)
+            return dst
+        man = read_manifest().get("temas", {})
+        tmp = dst.with_suffix(f".{uuid.uuid4().hex}.part")
+        used = set()
+        try:
+            # Los PDF y los MP4 ya vienen comprimidos: se guardan sin recomprimir
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for t in temas:
+                    topic = man.get(t, {})
+                    for b in ([bucket] if bucket else BUCKETS):
+                        for name, e in sorted(topic.get("files", {}).get(b, {}).items()):
+                            path = e.get("src") or bucket_join(topic_prefix(t), b, name)
+                            version = f"{e.get('mtime')}|{e.get('size')}|{e.get('sha256', '')}"
+                            with zf.open(_zip_arcname(t, b, name, e, used), "w", force_zip64=True) as out:
+                                _copy_object_into(path, version, out)
+                    links = topic.get("video_links", []) if not bucket else []
+                    if links:
+                        zf.writestr(f"{t}/videos/enlaces.txt",
+                                    "\n".join(f"{l.get('titulo') or 'Video'}: {l.get('url')}" for l in links))
+            tmp.replace(dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+        # Versiones viejas del mismo alcance y excedente por antigüedad
+        same_scope = dst.name.rsplit("_", 1)[0]
+        zips = sorted(EXPORT_DIR.glob("*.zip"), key=lambda f: f.stat().st_mtime, reverse=True)
+        for i, f in enumerate(zips):
+            if f != dst and (f.name.rsplit("_", 1)[0] == same_scope or i >= EXPORT_KEEP):
+                f.unlink(missing_ok=True)
+                if _export_marker(f).exists():
+                    _export_marker(f).unlink(missing_ok=True)
+                    storage_remove([export_remote(f)])
+        with reg["lock"]:
+            reg["building"].pop(dst.name, None)
+        if not SERVE_HOT_FILES:
+            _publish_export(dst)
+        return dst
+
+def export_widget(label: str, scope: str, temas: list[str], bucket: str | None = None, key: str = ""):
+    """Botón para preparar el ZIP y, cuando está listo, el enlace de descarga."""
+    dst = export_path(scope, temas, bucket)
+    if not export_ready(dst):
+        if st.button(f"📦 {label}", key=f"zip_{key or scope}"):
+            try:
+                with st.spinner("Armando ZIP…"):
+                    build_export(scope, temas, bucket)
+            except Exception as e:
+                st.error(f"No se pudo armar el ZIP: {e}")
+                return
+            flush_meta()
+            st.rerun()
+        return
+    size = human_mb(dst.stat().st_size)
+    if SERVE_HOT_FILES:
+        st.markdown(f"[⬇️ {label} ({size})](app/static/cache/zips/{dst.name})")
+    else:
+        url = object_urls([export_remote(dst)]).get(export_remote(dst))
+        if url:
+            st.markdown(f"[⬇️ {label} ({size})]({_encode_url(url)})")
+
+# ================== BÚSQUEDA EN PDFs ==================
+# Índice invertido por tema en search.json (junto a meta.json): término ->
+# {doc: {página: frecuencia}}, con doc = "bucket/archivo". El texto se extrae al
+# subir (pypdf, opcional) y se actualiza en forma incremental; la búsqueda une
+# los índices de todos los temas en memoria y rankea páginas con BM25.
+SEARCH_BUCKETS   = ("resumenes", "apuntes")
+SEARCH_MAX_PAGES = 500
+SEARCH_HITS      = 20
+PDF_TEXT         = importlib.util.find_spec("pypdf") is not None
+_STOPWORDS = set("""
+de la el los las un una unos unas y o u en con por para del al se su sus que es son como lo le
+les mas pero sin sobre entre este esta estos estas ese esa eso ya no si ha han hay muy tambien
+the of and to in is are for on with
+""".split())
+
+def search_terms(text: str) -> list[str]:
+    s = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [w[:32] for w in re.findall(r"[a-z0-9]{2,}", s) if w not in _STOPWORDS]
+
+def pdf_pages(fileobj) -> list[str]:
+    """Texto de cada página del PDF ([] si no hay pypdf o el PDF no se puede leer)."""
+    if not PDF_TEXT:
+        return []
+    from pypdf import PdfReader
+    try:
+        fileobj.seek(0)
+        reader = PdfReader(fileobj)
+        pages = []
+        for page in reader.pages[:SEARCH_MAX_PAGES]:
+            try:
+                pages.append(page.extract_text() or "")
+            except Exception:
+                pages.append("")
+        return pages
+    except Exception:
+        return []
+
+def search_path(tema: str) -> str:
+    return bucket_join(topic_prefix(tema), "search.json")
+
+def read_search(tema: str, strict: bool = False) -> dict:
+    """Como read_meta: {} solo si no hay search.json."""
+    p = search_path(tema)
+    hit = cache_get(("search", p))
+    if hit is not _MISS:
+        return hit  # solo lectura; commit_search trabaja sobre una copia
+    raw = storage_download(p, strict=strict)
+    idx = {}
+    if raw:
+        try:
+            idx = json.loads(raw.decode("utf-8"))
+        except Exception:
+            idx = {}
+    cache_put(("search", p), idx)
+    return idx
+
+def _write_search(tema: str, idx: dict):
+    p = search_path(tema)
+    storage_upload(p, json.dumps(idx, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                   content_type="application/json", quiet=True)
+    cache_put(("search", p), idx)
+
+def _search_init(idx: dict):
+    idx.setdefault("docs", {})
+    idx.setdefault("terms", {})
+
+def commit_search(tema: str, ops: list) -> dict:
+    return commit_versioned("search", search_path(tema), lambda: read_search(tema, strict=True),
+                            lambda idx: _write_search(tema, idx), [_search_init, *ops])
+
+def _index_drop(idx: dict, doc: str):
+    for term in idx["docs"].pop(doc, {}).get("terms", []):
+        postings = idx["terms"].get(term, {})
+        postings.pop(doc, None)
+        if not postings:
+            idx["terms"].pop(term, None)
+
+def _index_add(idx: dict, doc: str, pages: list[str]):
+    _index_drop(idx, doc)
+    lens, seen = [], set()
+    for n, text in enumerate(pages, start=1):
+        words = search_terms(text)
+        lens.append(len(words))
+        counts: dict[str, int] = {}
+        for w in words:
+            counts[w] = counts.get(w, 0) + 1
+        for w, tf in counts.items():
+            idx["terms"].setdefault(w, {}).setdefault(doc, {})[str(n)] = tf
+        seen.update(counts)
+    idx["docs"][doc] = {"lens": lens, "terms": sorted(seen)}
+
+def search_add(tema: str, docs: list[tuple]):
+    """Indexa [(bucket, archivo, páginas)] de un tema con una sola escritura."""
+    docs = [(b, n, pages) for b, n, pages in docs if b in SEARCH_BUCKETS and pages]
+    if docs:
+        commit_search(tema, [lambda idx: [_index_add(idx, f"{b}/{n}", pages) for b, n, pages in docs]])
+
+def _index_copy(idx: dict, doc: str, src: dict, src_doc: str):
+    """Copia a idx las entradas de src_doc de otro índice (el mismo PDF enlazado en otro tema)."""
+    _index_drop(idx, doc)
+    d = src["docs"][src_doc]
+    for term in d.get("terms", []):
+        pages = src.get("terms", {}).get(term, {}).get(src_doc)
+        if pages:
+            idx["terms"].setdefault(term, {})[doc] = dict(pages)
+    idx["docs"][doc] = copy.deepcopy(d)
+
+def search_link(tema: str, bucket: str, name: str, src_tema: str, src_bucket: str, src_name: str, fileobj):
+    """
+    Indexa un PDF enlazado desde otro tema: copia sus entradas del índice de
+    origen sin volver a extraer el texto (si allá no estaba indexado, lo extrae).
+    """
+    if bucket not in SEARCH_BUCKETS:
+        return
+    src_doc = f"{src_bucket}/{src_name}"
+    src = read_search(src_tema)
+    if src_doc in src.get("docs", {}):
+        commit_search(tema, [lambda idx: _index_copy(idx, f"{bucket}/{name}", src, src_doc)])
+    else:
+        search_add(tema, [(bucket, name, pdf_pages(fileobj))])
+
+def search_remove(tema: str, bucket: str, name: str):
+    if bucket in SEARCH_BUCKETS and f"{bucket}/{name}" in read_search(tema).get("docs", {}):
+        commit_search(tema, [lambda idx: _index_drop(idx, f"{bucket}/{name}")])
+
+def search_rebuild() -> int:
+    """Reindexa todos los PDF de resúmenes y apuntes desde Storage. Devuelve la cantidad de documentos."""
+    temas = read_manifest().get("temas", {})
+    def _one(t):
+        idx = {"docs": {}, "terms": {}}
+        for b in SEARCH_BUCKETS:
+            for name, e in temas[t].get("files", {}).get(b, {}).items():
+                if not name.lower().endswith(".pdf"):
+                    continue
+                raw = storage_download(e.get("src") or bucket_join(topic_prefix(t), b, name))
+                pages = pdf_pages(io.BytesIO(raw)) if raw else []
+                if pages:
+                    _index_add(idx, f"{b}/{name}", pages)
+        commit_search(t, [lambda cur: cur.update(idx)])
+        return len(idx["docs"])
+    return sum(io_map(_one, list(temas)))
+
+def _search_corpus() -> dict:
+    """Índices de todos los temas unidos; se rearma solo si cambió alguna versión."""
+    temas = list(read_manifest().get("temas", {}))
+    idxs = dict(zip(temas, io_map(read_search, temas)))
+    key = ("search_corpus", tuple((t, idxs[t].get("_version", 0)) for t in temas))
+    hit = cache_get(key)
+    if hit is not _MISS:
+        return hit
+    terms: dict[str, list] = {}
+    lens: dict[tuple, int] = {}
+    for t, idx in idxs.items():
+        for doc, d in idx.get("docs", {}).items():
+            for n, ln in enumerate(d.get("lens", []), start=1):
+                lens[(t, doc, n)] = ln
+        for w, postings in idx.get("terms", {}).items():
+            bucket = terms.setdefault(w, [])
+            for doc, pages in postings.items():
+                bucket.extend((t, doc, int(n), tf) for n, tf in pages.items())
+    corpus = {"terms": terms, "vocab": sorted(terms), "lens": lens,
+              "avg": (sum(lens.values()) / len(lens)) if lens else 1.0}
+    cache_put(key, corpus)
+    return corpus
+
+def search(query: str, k: int = SEARCH_HITS) -> list[tuple]:
+    """Páginas más relevantes: [(puntaje, tema, bucket, archivo, página)]."""
+    corpus = _search_corpus()
+    N, avg = max(len(corpus["lens"]), 1), corpus["avg"] or 1.0
+    scores: dict[tuple, float] = {}
+    for q in dict.fromkeys(search_terms(query)):
+        # Coincidencia exacta, o por prefijo desde 4 letras (nucleofil -> nucleofilica)
+        matches = [q] if q in corpus["terms"] else []
+        if len(q) >= 4:
+            i = bisect.bisect_left(corpus["vocab"], q)
+            while i < len(corpus["vocab"]) and corpus["vocab"][i].startswith(q):
+                if corpus["vocab"][i] != q:
+                    matches.append(corpus["vocab"][i])
+                i += 1
+        for w in matches:
+            postings = corpus["terms"][w]
+            idf = math.log(1 + (N - len(postings) + 0.5) / (len(postings) + 0.5))
+            for t, doc, n, tf in postings:
+                ln = corpus["lens"].get((t, doc, n), avg)
+                s = idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * ln / avg))
+                scores[(t, doc, n)] = scores.get((t, doc, n), 0.0) + s
+    best = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+    return [(sc, t, *doc.split("/", 1), n) for (t, doc, n), sc in best]
+
+def search_panel(query: str):
+    t0 = time.perf_counter()
+    try:
+        hits = search(query)
+    except StorageReadError as e:
+        st.error(f"No se pudo leer el índice de búsqueda: {e}. Reintentá.")
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    st.markdown(f"#### 🔎 Resultados para «{query}»")
+    if not hits:
+        st.info("Sin coincidencias en los PDF indexados.")
+        return
+    st.caption(f"{len(hits)} páginas · {ms:.0f} ms")
+    man = read_manifest().get("temas", {})
+    entries = {(t, b, n): man.get(t, {}).get("files", {}).get(b, {}).get(n, {}) for _, t, b, n, _ in hits}
+    urls = {k: e.get("url") for k, e in entries.items()}
+    if PRIVATE_BUCKET:
+        paths = {k: e.get("src") or bucket_join(topic_prefix(k[0]), k[1], k[2]) for k, e in entries.items()}
+        signed = object_urls(list(paths.values()))
+        urls = {k: signed.get(p) for k, p in paths.items()}
+    for _, t, b, n, page in hits:
+        title = entries[(t, b, n)].get("title") or n
+        url = urls.get((t, b, n))
+        link = f"[{title}]({_encode_url(url)}#page={page})" if url else title
+        st.markdown(f"- **{t}** · {b} · {link} — pág. {page}")
+
 # ================== CABECERA ==================
 st.markdown('<div class="header-utn">', unsafe_allow_html=True)
 if Path("logoutn.png").exists():
@@ -283,6 +1475,21 @@ with st.expander("🔐 Modo edición (subir/borrar/renombrar)", expanded=False):
         if st.button("Cerrar modo edición"):
             st.session_state["can_edit"] = False
             st.rerun()
+        if st.button("🔄 Reconstruir índice desde Storage"):
+            man = manifest_rebuild()
+            n = sum(len(f) for t in man["temas"].values() for f in t["files"].values())
+            if man.get("incomplete"):
+                st.warning(f"Índice armado con {n} archivos pero no se guardó: falló alguna lectura de Storage.")
+            else:
+                st.success(f"Índice reconstruido: {n} archivos en {len(man['temas'])} temas.")
+        if st.button("🔎 Reconstruir índice de búsqueda", disabled=not PDF_TEXT,
+                     help=None if PDF_TEXT else "Requiere el paquete pypdf"):
+            try:
+                with st.spinner("Extrayendo texto de los PDF…"):
+                    n = search_rebuild()
+                st.success(f"Índice de búsqueda reconstruido: {n} PDF.")
+            except Exception as e:
+                st.error(f"No se pudo reconstruir el índice de búsqueda: {e}")
     else:
         code = st.text_input("Ingresá el código de edición", type="password")
         if st.button("Ingresar"):
@@ -342,34 +1549,682 @@ with tab_esp:
 
 # Variable de trabajo final
 tema = st.session_state["tema"]
+try:
+    read_manifest()
+except StorageReadError as e:
+    st.error(f"No se pudo leer el índice de archivos desde Storage: {e}. Reintentá en unos segundos.")
+    st.stop()
+with st.sidebar:
+    st.markdown("---")
+    query = st.text_input("🔎 Buscar en resúmenes y apuntes", key="search_q",
+                          placeholder="p. ej. sustitución nucleofílica")
+    export_widget(f"Descargar el tema «{tema}»", tema, [tema])
+    export_widget("Descargar el curso completo", "curso", TEMAS)
+
+# ================== SUBIDA DESDE EL WIDGET ==================
+def file_sha256(up) -> str:
+    h = hashlib.sha256()
+    up.seek(0)
+    for block in iter(lambda: up.read(1024 * 1024), b""):
+        h.update(block)
+    up.seek(0)
+    return h.hexdigest()
+
+# ---------- Cola de subidas en segundo plano ----------
+# La transferencia corre en un pool propio (UPLOAD_WORKERS a la vez); la página
+# no se bloquea. El registro de trabajos es del proceso y cada sesión recuerda
+# los suyos; al terminar, el trabajo actualiza manifiesto y meta.json.
+UPLOAD_WORKERS  = 2
+UPLOAD_JOBS_MAX = 200  # trabajos terminados que se recuerdan
+
+class UploadCancelled(Exception):
+    pass
+
+@st.cache_resource
+def _upload_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+@st.cache_resource
+def _upload_jobs() -> dict:
+    return {"lock": threading.Lock(), "jobs": OrderedDict()}
+
+def upload_job_active(tema: str, bucket: str, digest: str) -> dict | None:
+    with _upload_jobs()["lock"]:
+        for job in _upload_jobs()["jobs"].values():
+            if (job["tema"], job["bucket"], job["digest"]) == (tema, bucket, digest) \
+                    and job["status"] in ("queued", "running"):
+                return job
+    return None
+
+# ---------- MP4: fast-start y metadatos ----------
+# Muchos MP4 (celulares, Zoom) traen el átomo moov al final y el navegador tiene
+# que bajar casi todo el archivo antes de reproducir. Al subir, se mueve moov
+# delante de mdat (como qt-faststart) corrigiendo los offsets de stco/co64, y de
+# paso se leen duración, resolución y bitrate. Si ya es fast-start no se toca.
+_MP4_PATH = (b"moov", b"trak", b"mdia", b"minf", b"stbl")  # contenedores hasta stco/co64
+
+def _mp4_boxes(buf: bytes, start: int = 0, end: int | None = None):
+    """Cajas de un bloque en memoria: (tipo, inicio, inicio del contenido, fin)."""
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = int.from_bytes(buf[pos:pos + 4], "big"), buf[pos + 4:pos + 8]
+        hdr = 8
+        if size == 1:
+            size, hdr = int.from_bytes(buf[pos + 8:pos + 16], "big"), 16
+        elif size == 0:
+            size = end - pos
+        if size < hdr or pos + size > end:
+            raise ValueError("MP4 con cajas inválidas")
+        yield kind, pos, pos + hdr, pos + size
+        pos += size
+
+def _mp4_top_level(f, size: int) -> list[tuple]:
+    """Cajas de primer nivel del archivo, leyendo solo los encabezados."""
+    boxes, pos = [], 0
+    while pos + 8 <= size:
+        f.seek(pos)
+        head = f.read(16)
+        box, kind, hdr = int.from_bytes(head[:4], "big"), head[4:8], 8
+        if box == 1:
+            box, hdr = int.from_bytes(head[8:16], "big"), 16
+        elif box == 0:
+            box = size - pos
+        if box < hdr or pos + box > size:
+            raise ValueError("MP4 con cajas inválidas")
+        boxes.append((kind, pos, box))
+        pos += box
+    return boxes
+
+def _mp4_patch(moov: bytes, shift: int, co64: bool, start: int = 8, end: int | None = None,
+               depth: int = 0) -> bytes:
+    """Contenido de moov con los chunk offsets desplazados (stco -> co64 si co64=True)."""
+    out = bytearray()
+    for kind, pos, body, stop in _mp4_boxes(moov, start, end):
+        if depth + 1 < len(_MP4_PATH) and kind == _MP4_PATH[depth + 1]:
+            inner = _mp4_patch(moov, shift, co64, body, stop, depth + 1)
+            out += (8 + len(inner)).to_bytes(4, "big") + kind + inner
+        elif depth == len(_MP4_PATH) - 1 and kind in (b"stco", b"co64"):
+            n = int.from_bytes(moov[body + 4:body + 8], "big")
+            width = 8 if kind == b"co64" else 4
+            offs = [int.from_bytes(moov[body + 8 + i * width:body + 8 + (i + 1) * width], "big") + shift
+                    for i in range(n)]
+            if kind == b"stco" and not co64 and offs and max(offs) >= 1 << 32:
+                raise OverflowError
+            new_kind, new_width = (b"co64", 8) if (kind == b"co64" or co64) else (b"stco", 4)
+            payload = moov[body:body + 4] + n.to_bytes(4, "big") + b"".join(o.to_bytes(new_width, "big") for o in offs)
+            out += (8 + len(payload)).to_bytes(4, "big") + new_kind + payload
+        else:
+            out += moov[pos:stop]
+    return bytes(out)
+
+def _mp4_info(moov: bytes, size: int) -> dict:
+    info = {}
+    for kind, _, body, stop in _mp4_boxes(moov, 8):
+        if kind == b"mvhd":
+            v1 = moov[body] == 1
+            ts_at = body + (20 if v1 else 12)
+            scale = int.from_bytes(moov[ts_at:ts_at + 4], "big")
+            dur = int.from_bytes(moov[ts_at + 4:ts_at + (12 if v1 else 8)], "big")
+            if scale:
+                info["duration"] = round(dur / scale, 2)
+        elif kind == b"trak":
+            tkhd, handler = None, None
+            for k2, _, b2, s2 in _mp4_boxes(moov, body, stop):
+                if k2 == b"tkhd":
+                    tkhd = moov[s2 - 8:s2]
+                elif k2 == b"mdia":
+                    for k3, _, b3, _ in _mp4_boxes(moov, b2, s2):
+                        if k3 == b"hdlr":
+                            handler = moov[b3 + 8:b3 + 12]
+            if handler == b"vide" and tkhd and "width" not in info:
+                info["width"] = int.from_bytes(tkhd[:4], "big") >> 16
+                info["height"] = int.from_bytes(tkhd[4:], "big") >> 16
+    if info.get("duration"):
+        info["bitrate"] = int(size * 8 / info["duration"])
+    return info
+
+def _mp4_read_moov(f, size: int):
+    boxes = _mp4_top_level(f, size)
+    moov = next((b for b in boxes if b[0] == b"moov"), None)
+    if moov is None:
+        raise ValueError("MP4 sin moov")
+    f.seek(moov[1])
+    return boxes, moov, f.read(moov[2])
+
+def mp4_probe(fileobj, size: int) -> dict:
+    """Duración (s), ancho, alto y bitrate (bit/s) leyendo solo el moov; {} si no se puede."""
+    try:
+        _, _, moov = _mp4_read_moov(fileobj, size)
+        return _mp4_info(moov, size)
+    except Exception:
+        return {}
+    finally:
+        fileobj.seek(0)
+
+def mp4_prepare(fileobj, size: int) -> tuple:
+    """
+    Devuelve (archivo, tamaño, info) listo para subir: el mismo objeto si ya es
+    fast-start (o no se puede interpretar), o una copia temporal con moov delante.
+    """
+    try:
+        boxes, moov_box, moov = _mp4_read_moov(fileobj, size)
+        info = _mp4_info(moov, size)
+        mdats = [b for b in boxes if b[0] == b"mdat"]
+        if not mdats or moov_box[1] < mdats[0][1] or moov_box[1] < mdats[-1][1] or moov_box[2] != len(moov):
+            fileobj.seek(0)
+            return fileobj, size, info
+        if int.from_bytes(moov[:4], "big") == 1:
+            moov = (len(moov) - 8).to_bytes(4, "big") + b"moov" + moov[16:]  # encabezado corto
+        try:
+            new_len = 8 + len(_mp4_patch(moov, 0, False))
+            body = _mp4_patch(moov, new_len, False)
+        except OverflowError:  # offsets > 4 GB: stco pasa a co64
+            new_len = 8 + len(_mp4_patch(moov, 0, True))
+            body = _mp4_patch(moov, new_len, True)
+        new_moov = (8 + len(body)).to_bytes(4, "big") + b"moov" + body
+        first = mdats[0][1]
+        out = tempfile.TemporaryFile()
+        def _copy(pos, n):
+            fileobj.seek(pos)
+            while n > 0:
+                block = fileobj.read(min(n, 1 << 20))
+                if not block:
+                    break
+                out.write(block)
+                n -= len(block)
+        for kind, pos, n in boxes:  # ftyp y demás cajas previas a mdat
+            if pos < first and kind != b"moov":
+                _copy(pos, n)
+        out.write(new_moov)
+        for kind, pos, n in boxes:
+            if pos >= first and kind != b"moov":
+                _copy(pos, n)
+        new_size = out.tell()
+        out.seek(0)
+        return out, new_size, info
+    except Exception:
+        fileobj.seek(0)
+        return fileobj, size, {}
+
+FFMPEG = shutil.which("ffmpeg")
+POSTER_SCAN_MB = 16  # con moov adelante, el primer cuadro está en el comienzo del archivo
+
+def mp4_poster(fileobj) -> bytes | None:
+    """Primer cuadro del video como JPEG chico (None si no hay ffmpeg o falla)."""
+    if not FFMPEG:
+        return None
+    with tempfile.TemporaryDirectory() as tmp:
+        src, out = Path(tmp) / "in.mp4", Path(tmp) / "poster.jpg"
+        fileobj.seek(0)
+        with open(src, "wb") as fh:
+            fh.write(fileobj.read(POSTER_SCAN_MB * 1024 * 1024))
+        fileobj.seek(0)
+        try:
+            subprocess.run([FFMPEG, "-v", "error", "-ss", "1", "-i", str(src), "-frames:v", "1",
+                            "-vf", "scale=480:-2", "-q:v", "5", "-y", str(out)],
+                           check=True, timeout=30, capture_output=True)
+            return out.read_bytes() if out.exists() else None
+        except Exception:
+            return None
+
+def upload_poster(tema: str, bucket: str, name: str, fileobj, info: dict):
+    """Sube el primer cuadro a <bucket>/.thumbs/ y anota su ruta en info["poster"]."""
+    jpg = mp4_poster(fileobj)
+    if jpg:
+        path = bucket_join(topic_prefix(tema), bucket, ".thumbs", f"{name}.jpg")
+        storage_upload(path, jpg, content_type="image/jpeg", quiet=True)
+        info["poster"] = path
+
+def _transfer(tema: str, bucket: str, fileobj, filename: str, size: int, content_type: str,
+              progress=None, digest: str = "") -> str:
+    """
+    Sube un archivo a la carpeta del bucket del tema; devuelve la ruta final. Una
+    subida cortada se retoma solo con el mismo contenido (digest), no con otro
+    archivo que tenga el mismo nombre y tamaño.
+    """
+    dst = bucket_join(topic_prefix(tema), bucket, f"{int(time.time())}_{safe_filename(filename)}")
+    if size <= TUS_CHUNK_MB * 1024 * 1024:
+        fileobj.seek(0)
+        storage_upload(dst, fileobj.read(), content_type=content_type, quiet=True)
+        return dst
+    return storage_upload_stream(
+        dst, fileobj, size, content_type, progress=progress,
+        resume_key=f"{bucket_join(topic_prefix(tema), bucket)}|{digest}|{size}" if digest else None,
+    )
+
+def _run_upload_job(job: dict, up, content_type: str, titulo: str):
+    if job["cancel"]:
+        job["status"] = "cancelled"
+        return
+    job["status"] = "running"
+    tema, bucket, size = job["tema"], job["bucket"], job["size"]
+    def _progress(done, total):
+        job["done"] = done
+        if job["cancel"]:
+            raise UploadCancelled()
+    src, info = up, {}
+    try:
+        if content_type == "video/mp4":
+            src, size, info = mp4_prepare(up, size)
+            job["size"] = size
+        dst = _transfer(tema, bucket, src, up.name, size, content_type, progress=_progress,
+                        digest=job["digest"])
+        job["done"] = size
+        name = dst.split("/")[-1]
+        if content_type == "video/mp4":
+            upload_poster(tema, bucket, name, src, info)
+        manifest_add_file(tema, bucket, name, size, sha256=job["digest"])
+        def _register(meta):
+            set_hash(meta, bucket, name, job["digest"])
+            set_media(meta, bucket, name, info)
+            if titulo.strip():
+                set_title(meta, bucket, name, titulo.strip())
+        commit_meta(tema, [_register], quiet=True)
+        if bucket in SEARCH_BUCKETS and name.lower().endswith(".pdf"):
+            try:
+                search_add(tema, [(bucket, name, pdf_pages(up))])
+            except Exception as e:
+                job["error"] = f"subido, pero sin indexar: {e!r}"[:300]
+        job.update(status="done", dst=dst)
+    except UploadCancelled:
+        job["status"] = "cancelled"
+    except Exception as e:
+        job.update(status="error", error=repr(e)[:300])
+    finally:
+        if src is not up:
+            src.close()  # copia temporal de mp4_prepare
+        job["finished"] = time.time()
+
+def _new_job(tema: str, bucket: str, name: str, size: int, digest: str) -> dict:
+    job = {"id": uuid.uuid4().hex[:12], "tema": tema, "bucket": bucket, "name": name,
+           "size": size, "digest": digest, "status": "queued", "done": 0,
+           "error": None, "dst": None, "cancel": False, "created": time.time(), "finished": None}
+    reg = _upload_jobs()
+    with reg["lock"]:
+        reg["jobs"][job["id"]] = job
+        finished = [k for k, j in reg["jobs"].items() if j["finished"]]
+        for k in finished[:max(0, len(finished) - UPLOAD_JOBS_MAX)]:
+            reg["jobs"].pop(k, None)
+    st.session_state.setdefault("my_jobs", []).append(job["id"])
+    return job
+
+def enqueue_upload(tema: str, bucket: str, up, content_type: str, titulo: str, digest: str) -> dict:
+    job = _new_job(tema, bucket, up.name, getattr(up, "size", 0), digest)
+    submit_with_ctx(_upload_pool(), _run_upload_job, job, up, content_type, titulo)
+    return job
+
+# ---------- Carga masiva ----------
+# Muchos archivos (o un ZIP) para un tema/bucket en un solo trabajo: las
+# transferencias van en paralelo (BULK_WORKERS) y al final hay una sola
+# actualización del manifiesto y una sola de meta.json.
+BULK_WORKERS = 4
+MIME_BY_EXT = {
+    ".pdf": "application/pdf", ".mp4": "video/mp4",
+    ".mp3": "audio/mpeg", ".wav": "audio/wav", ".m4a": "audio/mp4", ".ogg": "audio/ogg",
+}
+BUCKET_EXTS = {
+    "resumenes": {".pdf"}, "apuntes": {".pdf"}, "videos": {".mp4"},
+    "audios": {".mp3", ".wav", ".m4a", ".ogg"},
+}
+
+class _Blob(io.BytesIO):
+    """Archivo en memoria con la interfaz que usa la subida (name, size)."""
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name, self.size = name, len(data)
+
+class _ZipMember:
+    """
+    Miembro de un ZIP subido. El script solo lee el índice del ZIP (nombre y
+    tamaño declarado); el contenido se descomprime recién cuando el trabajo lo
+    lee, por bloques a un archivo temporal, así nunca queda entero en memoria.
+    """
+    def __init__(self, source, info: zipfile.ZipInfo, lock: threading.Lock):
+        self.name, self.size = Path(info.filename).name, info.file_size
+        self._source, self._info, self._lock, self._fh = source, info, lock, None
+
+    def _file(self):
+        if self._fh is None:
+            fh = tempfile.TemporaryFile()
+            with self._lock:  # el ZIP subido es un solo objeto compartido por los hilos
+                self._source.seek(0)
+                with zipfile.ZipFile(self._source) as zf, zf.open(self._info) as member:
+                    shutil.copyfileobj(member, fh, 1 << 20)
+            fh.seek(0)
+            self._fh = fh
+        return self._fh
+
+    def read(self, n: int = -1) -> bytes:
+        return self._file().read(n)
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        return self._file().seek(pos, whence)
+
+    def tell(self) -> int:
+        return self._file().tell()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+def title_from_filename(filename: str) -> str:
+    return re.sub(r"[_\-]+", " ", Path(filename).stem).strip()
+
+def read_titles_csv(raw: bytes) -> dict:
+    """CSV archivo,titulo (con o sin encabezado) -> {archivo: titulo}."""
+    out = {}
+    for row in csv.reader(io.StringIO(raw.decode("utf-8-sig"))):
+        if len(row) >= 2 and row[0].strip() and row[0].strip().lower() not in ("archivo", "filename"):
+            out[Path(row[0].strip()).name] = row[1].strip()
+    return out
+
+def expand_bulk_files(files: list, bucket: str) -> list:
+    """
+    Archivos del widget (o miembros de ZIPs) con extensión válida para el bucket.
+    De los ZIP solo se lee el índice: los miembros se abren en el trabajo.
+    """
+    exts, items = BUCKET_EXTS[bucket], []
+    for f in files:
+        if f.name.lower().endswith(".zip"):
+            lock = threading.Lock()
+            with zipfile.ZipFile(f) as zf:
+                for info in zf.infolist():
+                    base = Path(info.filename).name
+                    if not info.is_dir() and not base.startswith(".") and Path(base).suffix.lower() in exts:
+                        items.append(_ZipMember(f, info, lock))
+        elif Path(f.name).suffix.lower() in exts:
+            items.append(f)
+    return items
+
+def _run_bulk_job(job: dict, items: list, titles: dict):
+    job["status"] = "running"
+    tema, bucket = job["tema"], job["bucket"]
+    sent, sizes, media = {}, {}, {}
+    def _one(item, digest):
+        if job["cancel"]:
+            raise UploadCancelled()
+        ct = MIME_BY_EXT.get(Path(item.name).suffix.lower(), "application/octet-stream")
+        def _progress(done, total):
+            sent[item.name] = done
+            job["done"] = sum(sent.values())
+            if job["cancel"]:
+                raise UploadCancelled()
+        src, size = item, item.size
+        try:
+            if ct == "video/mp4":
+                src, size, media[item.name] = mp4_prepare(item, item.size)
+            dst = _transfer(tema, bucket, src, item.name, size, ct, progress=_progress, digest=digest)
+            if ct == "video/mp4":
+                upload_poster(tema, bucket, dst.split("/")[-1], src, media[item.name])
+        finally:
+            if src is not item:
+                src.close()  # copia temporal de mp4_prepare
+        sent[item.name] = sizes[item.name] = size
+        job["done"] = sum(sent.values())
+        return dst
+
+    added, errors, seen, names = [], [], set(), set()
+    try:
+        todo = []
+        for item in items:
+            if item.name in names:
+                errors.append(f"{item.name}: nombre repetido en el lote")
+                job["size"] -= item.size
+                continue
+            names.add(item.name)
+            if item.size > MAX_UPLOAD_MB * 1024 * 1024:  # antes de leerlo (un miembro de ZIP ni se descomprime)
+                errors.append(f"{item.name}: supera {MAX_UPLOAD_MB} MB")
+                job["size"] -= item.size
+                continue
+            digest = file_sha256(item)
+            dup = manifest_find_hash(digest, prefer=(tema, bucket))
+            if digest in seen or (dup and dup[:2] == (tema, bucket)):
+                job["size"] -= item.size  # repetido: no se transfiere
+                continue
+            seen.add(digest)
+            if dup:
+                t0, b0, name0, e0 = dup
+                added.append((item, name0, digest, e0.get("src") or bucket_join(topic_prefix(t0), b0, name0)))
+                if item.name.lower().endswith(".mp4"):
+                    media[item.name] = e0.get("media") or mp4_probe(item, item.size)
+                job["size"] -= item.size
+            else:
+                todo.append((item, digest))
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk") as pool:
+            futures = [(item, digest, pool.submit(_one, item, digest)) for item, digest in todo]
+            for item, digest, fut in futures:
+                try:
+                    added.append((item, fut.result().split("/")[-1], digest, ""))
+                except UploadCancelled:
+                    pass
+                except Exception as e:
+                    errors.append(f"{item.name}: {e!r}"[:200])
+        if added:
+            manifest_add_files(tema, bucket, [(n, sizes.get(it.name, it.size), d, src)
+                                              for it, n, d, src in added])
+            def _register(meta):
+                for it, name, digest, src in added:
+                    set_hash(meta, bucket, name, digest)
+                    set_media(meta, bucket, name, media.get(it.name))
+                    if src:
+                        set_ref(meta, bucket, name, src, it.size)
+                    set_title(meta, bucket, name, titles.get(it.name) or title_from_filename(it.name))
+            commit_meta(tema, [_register], quiet=True)
+            if bucket in SEARCH_BUCKETS:
+                try:
+                    search_add(tema, [(bucket, n, pdf_pages(it)) for it, n, _, _ in added
+                                      if n.lower().endswith(".pdf")])
+                except Exception as e:
+                    errors.append(f"índice de búsqueda: {e!r}"[:200])
+        job["status"] = "cancelled" if job["cancel"] else ("error" if errors and not added else "done")
+        job["name"] = f"{len(added)} de {len(items)} archivos"
+        if errors:
+            job["error"] = "; ".join(errors)[:300]
+    except Exception as e:
+        job.update(status="error", error=repr(e)[:300])
+    finally:
+        for item in items:
+            if isinstance(item, _ZipMember):
+                item.close()
+        job["finished"] = time.time()
+
+def bulk_upload_panel(tema: str):
+    with st.expander(f"📦 Carga masiva — {tema}", expanded=False):
+        bucket = st.selectbox("Destino", BUCKETS, key=f"bulk_bucket_{tema}")
+        exts = sorted(e.lstrip(".") for e in BUCKET_EXTS[bucket])
+        files = st.file_uploader(f"Archivos ({', '.join(exts)}) o ZIP", type=exts + ["zip"],
+                                 accept_multiple_files=True, key=f"bulk_files_{tema}_{bucket}")
+        csv_up = st.file_uploader("Títulos (CSV opcional: archivo,titulo)", type=["csv"],
+                                  key=f"bulk_csv_{tema}")
+        st.caption("Sin CSV, el título sale del nombre del archivo.")
+        if files and st.button("Subir todo", key=f"bulk_go_{tema}"):
+            items = expand_bulk_files(files, bucket)
+            if not items:
+                st.error("No hay archivos válidos para ese destino.")
+                return
+            titles = read_titles_csv(csv_up.getvalue()) if csv_up else {}
+            job = _new_job(tema, bucket, f"{len(items)} archivos", sum(i.size for i in items),
+                           f"bulk:{uuid.uuid4().hex}")
+            submit_with_ctx(_upload_pool(), _run_bulk_job, job, items, titles)
+            st.info(f"{len(items)} archivos en cola; el avance aparece en «Subidas».")
+
+def _upload_jobs_body():
+    reg = _upload_jobs()
+    with reg["lock"]:
+        mine = [reg["jobs"][k] for k in st.session_state.get("my_jobs", []) if k in reg["jobs"]]
+    if not mine:
+        return
+    st.markdown("##### Subidas")
+    for job in mine:
+        c1, c2 = st.columns([5, 1])
+        with c1:
+            frac = job["done"] / job["size"] if job["size"] else 1.0
+            label = {"queued": "en cola", "running": "subiendo", "done": "lista", "error": "falló",
+                     "cancelled": "cancelada"}[job["status"]]
+            st.progress(min(frac, 1.0), text=f"{job['name']} → {job['tema']}/{job['bucket']}: {label} "
+                                             f"({human_mb(job['done'])} / {human_mb(job['size'])})")
+            if job["error"]:
+                st.caption(f"Detalle: {job['error']}")
+        with c2:
+            if job["status"] in ("queued", "running"):
+                if st.button("Cancelar", key=f"cancel_{job['id']}"):
+                    job["cancel"] = True
+            elif st.button("Quitar", key=f"clear_{job['id']}"):
+                st.session_state["my_jobs"].remove(job["id"])
+                flush_meta()
+                st.rerun()
+    seen = st.session_state.setdefault("jobs_seen_done", set())
+    newly = [j["id"] for j in mine if j["status"] == "done" and j["id"] not in seen]
+    if newly:
+        seen.update(newly)
+        flush_meta()
+        st.rerun()  # refresca listados con lo recién subido
+
+def upload_jobs_panel():
+    """Estado de las subidas de esta sesión; se refresca solo mientras haya activas."""
+    mine = set(st.session_state.get("my_jobs", []))
+    active = any(j["status"] in ("queued", "running")
+                 for k, j in list(_upload_jobs()["jobs"].items()) if k in mine)
+    if hasattr(st, "fragment"):  # streamlit >= 1.37
+        st.fragment(run_every=2 if active else None)(_upload_jobs_body)()
+    else:
+        _upload_jobs_body()
+        if active:
+            st.button("🔄 Actualizar estado de subidas")
+
+def ingest_upload(tema: str, bucket: str, up, content_type: str, titulo: str = ""):
+    """
+    Registra un archivo del file_uploader en el bucket del tema. Cada archivo del
+    widget se procesa una sola vez por sesión (por file_id): los reruns con el
+    archivo aún en el widget no lo vuelven a leer ni a subir, tampoco después de
+    borrarlo de la lista. Si el mismo contenido ya está en este tema/bucket (o
+    subiéndose) no hace nada; si está en otro tema lo enlaza sin transferir; si
+    no, encola la subida en segundo plano.
+    """
+    size = getattr(up, "size", 0)
+    done = st.session_state.setdefault("ingested", set())
+    fid = getattr(up, "file_id", None) or f"{up.name}:{size}"
+    if fid in done:
+        return
+    done.add(fid)
+    digest = file_sha256(up)
+    dup = manifest_find_hash(digest, prefer=(tema, bucket))
+    if dup and dup[:2] == (tema, bucket):
+        st.info(f"«{up.name}» ya está cargado en este tema ({dup[2]}).")
+        return
+    if upload_job_active(tema, bucket, digest):
+        return  # el panel de subidas muestra el avance
+    if not dup:
+        enqueue_upload(tema, bucket, up, content_type, titulo, digest)
+        st.info(f"«{up.name}» en cola de subida; podés seguir usando la página.")
+        return
+
+    t0, b0, name, entry0 = dup
+    src = entry0.get("src") or bucket_join(topic_prefix(t0), b0, name)
+    manifest_add_file(tema, bucket, name, size, sha256=digest, src=src)
+    info = (entry0.get("media") or mp4_probe(up, size)) if content_type == "video/mp4" else {}
+    def _register(meta):
+        set_hash(meta, bucket, name, digest)
+        set_ref(meta, bucket, name, src, size)
+        set_media(meta, bucket, name, info)
+        if titulo.strip():
+            set_title(meta, bucket, name, titulo.strip())
+    meta_op(tema, _register)
+    st.info(f"«{up.name}» ya existía en «{t0}»: se enlazó sin volver a subirlo.")
+    if bucket in SEARCH_BUCKETS and name.lower().endswith(".pdf"):
+        try:
+            search_link(tema, bucket, name, t0, b0, name, up)
+        except Exception as e:
+            st.warning(f"«{up.name}» quedó enlazado, pero sin indexar para la búsqueda: {e!r}"[:300])
 
 # ================== LISTADO REUTILIZABLE ==================
-def render_list(bucket_name: str, tema: str, exts: set[str], media: str | None = None):
+RENDER_PAGE = 20  # archivos por tanda; "Mostrar más" agrega otra
+
+def youtube_thumb(url: str) -> str | None:
+    """Miniatura estática de YouTube (sin cargar el reproductor)."""
+    u = urlparse(url)
+    host, vid = u.netloc.lower(), None
+    if "youtu.be" in host:
+        vid = u.path.strip("/").split("/")[0]
+    elif "youtube.com" in host:
+        vid = (parse_qs(u.query).get("v") or [None])[0]
+        m = re.match(r"/(?:embed|shorts|live)/([\w\-]+)", u.path)
+        vid = vid or (m.group(1) if m else None)
+    return f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg" if vid else None
+
+def media_card(key: str, kind: str, url: str, thumb: str | None = None, caption: str = ""):
+    """
+    Tarjeta liviana en lugar del reproductor: miniatura (si hay) y un botón que
+    carga el reproductor real. Hay un solo reproductor activo por sesión.
+    """
+    if st.session_state.get("player") == key:
+        if kind == "audio":
+            st.audio(url)
+        else:
+            st.video(url)
+        return
+    if thumb:
+        st.image(thumb, width=320, caption=caption or None)
+    elif caption:
+        st.caption(("🎬 " if kind == "video" else "🎧 ") + caption)
+    if st.button("▶️ Reproducir", key=f"play_{key}"):
+        st.session_state["player"] = key
+        flush_meta()
+        st.rerun()
+
+def media_facts(info: dict | None) -> list[str]:
+    """Duración, resolución y bitrate para el pie de un video ([] si no hay datos)."""
+    if not info:
+        return []
+    facts = []
+    if info.get("duration"):
+        m, sec = divmod(int(info["duration"]), 60)
+        facts.append(f"{m // 60}:{m % 60:02d}:{sec:02d}" if m >= 60 else f"{m}:{sec:02d}")
+    if info.get("width"):
+        facts.append(f"{info['width']}×{info['height']}")
+    if info.get("bitrate"):
+        br = info["bitrate"]
+        facts.append(f"{br / 1e6:.1f} Mbps" if br >= 1e6 else f"{br // 1000} kbps")
+    return facts
+
+def render_list(bucket_name: str, tema: str, exts: set[str], media: str | None = None,
+                topic: dict | None = None):
     can_edit = st.session_state["can_edit"]
     folder = bucket_join(topic_prefix(tema), bucket_name)
-    objs = storage_list(folder)
-    if not objs:
+    if topic is None:
+        topic = manifest_topic(tema)
+    files = topic.get("files", {}).get(bucket_name, {})
+    if not files:
         st.info("No hay archivos cargados aún.")
         return
 
-    meta = read_meta(tema)
-    st.markdown("#### Archivos cargados")
-    for obj in sorted(objs, key=lambda o: o.get("name","").lower()):
-        name = obj.get("name","")
-        if not any(name.lower().endswith(e) for e in exts):
-            continue
+    names = [n for n in sorted(files, key=str.lower) if any(n.lower().endswith(e) for e in exts)]
+    shown_key = f"shown_{bucket_name}_{tema}"
+    shown = st.session_state.get(shown_key, RENDER_PAGE)
+    st.markdown(f"#### Archivos cargados ({len(names)})")
+    export_widget(f"Descargar todo ({bucket_name})", f"{tema}_{bucket_name}", [tema], bucket_name)
+    for name in names[:shown]:
+        entry = files[name]
         full_path = bucket_join(folder, name)
-        url = public_url(full_path)
-        title = get_title(meta, bucket_name, name) or name
+        url = entry.get("url")
+        title = entry.get("title") or name
+        if SERVE_HOT_FILES and name.lower().endswith(".pdf"):
+            obj_path = entry.get("src") or full_path
+            version = f"{entry.get('mtime')}|{entry.get('size')}|{entry.get('sha256', '')}"
+            local = disk_cache_peek(obj_path, version)
+            if local is not None:
+                url = f"app/static/cache/{local.name}"
+            else:
+                disk_cache_prefetch(obj_path, version)  # el próximo que lo abra lo recibe de la app
 
         cols = st.columns([4, 2, 1, 1]) if can_edit else st.columns([6, 2])
         with cols[0]:
             st.write(f"**{title}**")
-            st.caption(name)
-            if url and media == "video":
-                st.video(_encode_url(url))
-            elif url and media == "audio":
-                st.audio(_encode_url(url))
+            st.caption(" · ".join([name, human_mb(entry.get("size") or 0)] + media_facts(entry.get("media"))))
+            if url and media in ("video", "audio"):
+                media_card(f"{tema}/{bucket_name}/{name}", media, _encode_url(url), entry.get("poster_url"))
         with cols[1]:
             if url:
                 st.markdown(f"[Abrir / Descargar]({_encode_url(url)})")
@@ -379,23 +2234,34 @@ def render_list(bucket_name: str, tema: str, exts: set[str], media: str | None =
                                           key=f"ttl_{bucket_name}_{name}")
             with cols[3]:
                 if st.button("🗑️ Eliminar", key=f"del_{bucket_name}_{name}"):
-                    storage_remove([full_path])
-                    set_title(meta, bucket_name, name, "")
-                    write_meta(tema, meta)
+                    # El objeto se borra solo si ninguna otra entrada (ref de otro tema) lo usa
+                    obj_path = entry.get("src") or full_path
+                    if not manifest_object_in_use(obj_path, (tema, bucket_name, name)):
+                        poster = (entry.get("media") or {}).get("poster")
+                        storage_remove([obj_path] + ([poster] if poster else []))
+                    manifest_remove_file(tema, bucket_name, name)
+                    try:
+                        search_remove(tema, bucket_name, name)
+                    except Exception as e:
+                        st.warning(f"Eliminado, pero sigue en el índice de búsqueda: {e}")
+                    meta_op(tema, lambda m, b=bucket_name, n=name: forget_file(m, b, n))
+                    flush_meta()
                     st.success(f"Eliminado: {name}")
                     st.rerun()
             if new_title != (title if title != name else ""):
-                set_title(meta, bucket_name, name, new_title)
-                write_meta(tema, meta)
+                meta_op(tema, lambda m, b=bucket_name, n=name, t=new_title: set_title(m, b, n, t))
+    if len(names) > shown:
+        if st.button(f"Mostrar más ({len(names) - shown} restantes)", key=f"more_{bucket_name}_{tema}"):
+            st.session_state[shown_key] = shown + RENDER_PAGE
+            flush_meta()
+            st.rerun()
 
-# ================== TABS DE CONTENIDO ==================
-tabs = st.tabs([
-    "📄 PDF Resúmenes", "📘 PDF Apuntes del profesor",
-    "🎥 Videos (MP4 o enlace)", "🎧 Audios (MP3)"
-])
+# ================== SECCIONES DE CONTENIDO ==================
+# Cada sección es una función: solo se ejecuta (y solo crea reproductores) la
+# que está seleccionada, a diferencia de st.tabs que corre todas en cada rerun.
 
 # -------- TAB 1: RESÚMENES --------
-with tabs[0]:
+def tab_resumenes(tema: str, topic: dict):
     st.subheader(f"Resúmenes — {tema}")
     if st.session_state["can_edit"]:
         c1, c2 = st.columns([2,3])
@@ -407,17 +2273,11 @@ with tabs[0]:
             if too_big(up):
                 st.error(f"El archivo ({human_mb(up.size)}) supera {MAX_UPLOAD_MB} MB. Comprimilo o subilo como enlace.")
             else:
-                dst = bucket_join(topic_prefix(tema), "resumenes", f"{int(time.time())}_{safe_filename(up.name)}")
-                storage_upload(dst, up.read(), content_type="application/pdf")
-                if titulo_pdf.strip():
-                    meta = read_meta(tema)
-                    set_title(meta, "resumenes", dst.split("/")[-1], titulo_pdf.strip())
-                    write_meta(tema, meta)
-                st.success(f"Subido: {up.name}")
-    render_list("resumenes", tema, exts={".pdf"})
+                ingest_upload(tema, "resumenes", up, "application/pdf", titulo_pdf)
+    render_list("resumenes", tema, exts={".pdf"}, topic=topic)
 
 # -------- TAB 2: APUNTES --------
-with tabs[1]:
+def tab_apuntes(tema: str, topic: dict):
     st.subheader(f"Apuntes del profesor — {tema}")
     if st.session_state["can_edit"]:
         c1, c2 = st.columns([2,3])
@@ -429,19 +2289,12 @@ with tabs[1]:
             if too_big(up):
                 st.error(f"El archivo ({human_mb(up.size)}) supera {MAX_UPLOAD_MB} MB. Comprimilo o subilo como enlace.")
             else:
-                dst = bucket_join(topic_prefix(tema), "apuntes", f"{int(time.time())}_{safe_filename(up.name)}")
-                storage_upload(dst, up.read(), content_type="application/pdf")
-                if titulo_pdf.strip():
-                    meta = read_meta(tema)
-                    set_title(meta, "apuntes", dst.split("/")[-1], titulo_pdf.strip())
-                    write_meta(tema, meta)
-                st.success(f"Subido: {up.name}")
-    render_list("apuntes", tema, exts={".pdf"})
+                ingest_upload(tema, "apuntes", up, "application/pdf", titulo_pdf)
+    render_list("apuntes", tema, exts={".pdf"}, topic=topic)
 
 # -------- TAB 3: VIDEOS --------
-with tabs[2]:
+def tab_videos(tema: str, topic: dict):
     st.subheader(f"Videos — {tema}")
-    meta = read_meta(tema)
 
     # a) MP4 a Storage
     if st.session_state["can_edit"]:
@@ -454,31 +2307,25 @@ with tabs[2]:
             if too_big(up):
                 st.error(f"El video ({human_mb(up.size)}) supera {MAX_UPLOAD_MB} MB. Subilo como enlace (YouTube/Drive/Zoom) o recomprimilo (720p).")
             else:
-                dst = bucket_join(topic_prefix(tema), "videos", f"{int(time.time())}_{safe_filename(up.name)}")
-                storage_upload(dst, up.read(), content_type="video/mp4")
-                if titulo_mp4.strip():
-                    set_title(meta, "videos", dst.split("/")[-1], titulo_mp4.strip())
-                    write_meta(tema, meta)
-                st.success(f"Subido: {up.name}")
+                ingest_upload(tema, "videos", up, "video/mp4", titulo_mp4)
 
     # b) Enlaces externos (YouTube/Drive/Zoom)
-    links = meta.get("video_links", [])
+    links = topic.get("video_links", [])
     if st.session_state["can_edit"]:
         st.markdown("##### Agregar enlace (YouTube/Drive/Zoom)")
         url = st.text_input("URL del video", key=f"url_{tema}")
         titulo = st.text_input("Título del video (opcional)", key=f"ttl_{tema}")
         if st.button("Agregar enlace", key=f"addlink_{tema}"):
             if url.strip():
-                meta = read_meta(tema)
-                add_link(meta, titulo, url)
-                write_meta(tema, meta)
+                meta_op(tema, lambda m: add_link(m, titulo, url))
+                flush_meta()
                 st.success("Enlace agregado.")
                 st.rerun()
             else:
                 st.error("Pegá una URL válida.")
 
     # Mostrar material
-    render_list("videos", tema, exts={".mp4"}, media="video")
+    render_list("videos", tema, exts={".mp4"}, media="video", topic=topic)
     if links:
         st.markdown("##### Enlaces")
         for i, it in enumerate(links):
@@ -489,7 +2336,7 @@ with tabs[2]:
                 url_norm = drive_preview_url(url_raw)
                 if should_embed(url_norm):
                     st.write(f"**{titulo}**")
-                    st.video(url_norm)
+                    media_card(f"{tema}/link/{i}/{url_norm}", "video", url_norm, youtube_thumb(url_norm))
                     st.markdown(f"[Abrir en pestaña]({_encode_url(url_norm)})")
                 else:
                     st.write(f"**{titulo}**")
@@ -497,17 +2344,16 @@ with tabs[2]:
             if st.session_state["can_edit"]:
                 with cols[1]:
                     if st.button("🗑️ Eliminar enlace", key=f"del_link_{i}"):
-                        meta = read_meta(tema)
-                        delete_link(meta, i)
-                        write_meta(tema, meta)
+                        meta_op(tema, lambda m, i=i, it=it: delete_link(m, i, it))
+                        flush_meta()
                         st.success("Enlace eliminado.")
                         st.rerun()
     else:
-        if not storage_list(bucket_join(topic_prefix(tema), "videos")):
+        if not topic.get("files", {}).get("videos"):
             st.info("Todavía no hay videos cargados.")
 
 # -------- TAB 4: AUDIOS --------
-with tabs[3]:
+def tab_audios(tema: str, topic: dict):
     st.subheader(f"Audios — {tema}")
     if st.session_state["can_edit"]:
         c1, c2 = st.columns([2,3])
@@ -519,17 +2365,51 @@ with tabs[3]:
             if too_big(up):
                 st.error(f"El audio ({human_mb(up.size)}) supera {MAX_UPLOAD_MB} MB. Comprimilo (mp3 ~128 kbps) o subilo como enlace.")
             else:
-                dst = bucket_join(topic_prefix(tema), "audios", f"{int(time.time())}_{safe_filename(up.name)}")
-                mime = {
-                    ".mp3":"audio/mpeg", ".wav":"audio/wav", ".m4a":"audio/mp4", ".ogg":"audio/ogg"
-                }.get(Path(up.name).suffix.lower(), "application/octet-stream")
-                storage_upload(dst, up.read(), content_type=mime)
-                if titulo_aud.strip():
-                    meta = read_meta(tema)
-                    set_title(meta, "audios", dst.split("/")[-1], titulo_aud.strip())
-                    write_meta(tema, meta)
-                st.success(f"Subido: {up.name}")
-    render_list("audios", tema, exts={".mp3",".wav",".m4a",".ogg"}, media="audio")
+                mime = MIME_BY_EXT.get(Path(up.name).suffix.lower(), "application/octet-stream")
+                ingest_upload(tema, "audios", up, mime, titulo_aud)
+    render_list("audios", tema, exts={".mp3",".wav",".m4a",".ogg"}, media="audio", topic=topic)
+
+SECCIONES = {
+    "📄 PDF Resúmenes": tab_resumenes,
+    "📘 PDF Apuntes del profesor": tab_apuntes,
+    "🎥 Videos (MP4 o enlace)": tab_videos,
+    "🎧 Audios (MP3)": tab_audios,
+}
+SECCION_BUCKETS = dict(zip(SECCIONES, (["resumenes"], ["apuntes"], ["videos"], ["audios"])))
+if st.session_state.get("seccion") not in SECCIONES:
+    st.session_state["seccion"] = next(iter(SECCIONES))
+sel_seccion = st.radio("Sección", list(SECCIONES), horizontal=True, label_visibility="collapsed",
+                       index=list(SECCIONES).index(st.session_state["seccion"]))
+if sel_seccion != st.session_state["seccion"]:
+    st.session_state["seccion"] = sel_seccion
+if query.strip():
+    search_panel(query.strip())
+    st.markdown("---")
+if st.session_state["can_edit"]:
+    bulk_upload_panel(tema)
+    upload_jobs_panel()
+# solo se resuelven (y firman, con bucket privado) las URLs de la sección elegida
+topic = fetch_topic(tema, SECCION_BUCKETS[st.session_state["seccion"]])
+SECCIONES[st.session_state["seccion"]](tema, topic)
+
+flush_meta()
+
+# ---------- Tiempos de Storage de este rerun (dentro del diagnóstico) ----------
+if diag is not None:
+    with diag:
+        st.markdown("**Llamadas a Storage en este rerun**")
+        summary = rerun_summary()
+        if summary:
+            total_ms = sum(t["ms"] for t in summary)
+            st.caption(f"{sum(t['llamadas'] for t in summary)} llamadas · {total_ms:.0f} ms en Storage · "
+                       f"{(time.perf_counter() - _rerun_t0) * 1000:.0f} ms de rerun")
+            st.table(summary)
+            slow = sorted(_rerun_calls, key=lambda c: -c["ms"])[:5]
+            st.caption("Más lentas: " + " | ".join(f"{c['op']} {c['path'] or '/'} {c['ms']:.0f} ms" for c in slow))
+        else:
+            st.caption("Ninguna: todo salió de caché.")
+        st.download_button("Exportar llamadas recientes (JSONL)", metrics_jsonl(),
+                           file_name="storage_calls.jsonl", mime="application/json")
 
 # ================== PIE ==================
 st.markdown("---")
@@ -0,0 +1,165 @@
+"""
+Benchmark de APP.py sin Supabase: corre la app con Streamlit AppTest sobre el
+backend local (storage_local.py, en memoria) y mide, por escenario, el tiempo
+de rerun, las llamadas a Storage y el pico de memoria (tracemalloc).
+
+  python benchmarks/bench_render.py                       # 10/100/1000 objetos, latencia 20 ms
+  python benchmarks/bench_render.py --objects 10,100 --latency-ms 50 --upload-mb 1,10
+  python benchmarks/bench_render.py --json resultados.json
+
+Escenarios de render (N objetos por bucket en un tema):
+  cold   primer rerun de un proceso nuevo (arma el manifiesto desde Storage)
+  warm   rerun siguiente (todo desde caché)
+  videos cambio a la sección Videos (tarjetas de reproductor)
+  more   "Mostrar más" en la lista de resúmenes
+
+Subidas: un archivo de cada tamaño hasta MAX_UPLOAD_MB, por el mismo camino que
+el trabajo en segundo plano (_run_upload_job), de forma sincrónica. AppTest no
+simula st.file_uploader, así que ese escenario agrega un pequeño driver al final
+del script. El pico de memoria de las subidas incluye el archivo de prueba y la
+copia que guarda el backend en memoria.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import storage_local
+
+APP = ROOT / "APP.py"
+TEMA = "Conceptos básicos"
+FOLDER = "Quimica_Organica/conceptos_basicos"
+BUCKETS = {"resumenes": ".pdf", "apuntes": ".pdf", "videos": ".mp4", "audios": ".mp3"}
+
+UPLOAD_DRIVER = '''
+if st.session_state.get("_bench_upload"):
+    _mb = st.session_state.pop("_bench_upload")
+    _blob = _Blob("bench.mp3", os.urandom(int(_mb * 1024 * 1024)))
+    _job = _new_job(tema, "audios", _blob.name, _blob.size, file_sha256(_blob))
+    _run_upload_job(_job, _blob, "audio/mpeg", "")
+    st.session_state["_bench_job"] = {k: _job[k] for k in ("status", "error", "size")}
+'''
+
+
+def fresh_process(seed_objects: int = 0):
+    """Lo más parecido a un proceso nuevo: sin cachés de Streamlit ni objetos previos."""
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    storage_local.MemoryStore._shared.clear()
+    store = storage_local.MemoryStore("utn")
+    for bucket, ext in BUCKETS.items():
+        for i in range(seed_objects):
+            store.put(f"{FOLDER}/{bucket}/archivo_{i:04d}{ext}", b"x" * 2048, "application/octet-stream")
+    storage_local.reset_stats()
+
+
+def make_app(args, cache_dir: str, source: str | None = None) -> AppTest:
+    at = (AppTest.from_string(source, default_timeout=args.timeout) if source
+          else AppTest.from_file(str(APP), default_timeout=args.timeout))
+    at.secrets["STORAGE_BACKEND"] = "memory"
+    at.secrets["STORAGE_LATENCY_MS"] = args.latency_ms
+    at.secrets["STORAGE_MBPS"] = args.mbps
+    at.secrets["DISK_CACHE_DIR"] = cache_dir
+    at.secrets["MAX_UPLOAD_MB"] = args.max_upload_mb
+    at.session_state["tema"] = TEMA
+    return at
+
+
+TRACE_MEMORY = True  # tracemalloc encarece cada rerun; --no-memory lo apaga para medir solo tiempo
+
+def measure(label: str, fn) -> dict:
+    storage_local.reset_stats()
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    at = fn()
+    secs = time.perf_counter() - t0
+    peak = 0
+    if TRACE_MEMORY:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    errors = [str(e.value)[:200] for e in at.exception] if at is not None else []
+    return {"scenario": label, "ms": round(secs * 1000, 1),
+            "storage_calls": sum(storage_local.STATS.values()),
+            "calls": dict(storage_local.STATS),
+            "storage_mb": round(sum(storage_local.STATS_BYTES.values()) / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2), "errors": errors}
+
+
+def bench_render(args, n: int, cache_dir: str) -> list[dict]:
+    fresh_process(n)
+    at = make_app(args, cache_dir)
+    rows = [measure(f"cold  n={n}", lambda: at.run()),
+            measure(f"warm  n={n}", lambda: at.run())]
+
+    def _videos():
+        at.radio[0].set_value(next(o for o in at.radio[0].options if "ideo" in o))
+        return at.run()
+    rows.append(measure(f"videos n={n}", _videos))
+    at.radio[0].set_value(at.radio[0].options[0]).run()
+
+    more = [b for b in at.button if b.label.startswith("Mostrar más")]
+    if more:  # solo si hay más archivos que una tanda
+        rows.append(measure(f"more  n={n}", lambda: more[0].click().run()))
+    return rows
+
+
+def bench_upload(args, mb: float, cache_dir: str) -> dict:
+    fresh_process(0)
+    source = APP.read_text("utf-8") + UPLOAD_DRIVER
+    at = make_app(args, cache_dir, source)
+    at.session_state["can_edit"] = True
+    at.run()
+    at.session_state["_bench_upload"] = mb
+    row = measure(f"upload {mb:g} MB", lambda: at.run())
+    job = at.session_state["_bench_job"] if "_bench_job" in at.session_state else {}
+    if job.get("status") != "done":
+        row["errors"].append(f"job: {job}")
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--objects", default="10,100,1000", help="objetos por bucket del tema")
+    ap.add_argument("--upload-mb", default=None, help="tamaños de subida en MB (por defecto 1, 10 y MAX_UPLOAD_MB)")
+    ap.add_argument("--max-upload-mb", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="latencia agregada a cada llamada a Storage")
+    ap.add_argument("--mbps", type=float, default=0.0, help="ancho de banda simulado (0 = sin límite)")
+    ap.add_argument("--timeout", type=float, default=300.0)
+    ap.add_argument("--no-memory", action="store_true", help="no medir memoria (tiempos sin el costo de tracemalloc)")
+    ap.add_argument("--json", help="guardar los resultados en este archivo")
+    args = ap.parse_args()
+    global TRACE_MEMORY
+    TRACE_MEMORY = not args.no_memory
+
+    os.chdir(ROOT)  # la app busca logoutn.png relativo al directorio actual
+    sizes = [float(x) for x in args.upload_mb.split(",")] if args.upload_mb else \
+        sorted({1.0, 10.0, float(args.max_upload_mb)})
+    rows = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for n in [int(x) for x in args.objects.split(",")]:
+            rows += bench_render(args, n, f"{cache_dir}/n{n}")
+        for mb in sizes:
+            if mb <= args.max_upload_mb:
+                rows.append(bench_upload(args, mb, f"{cache_dir}/up{mb:g}"))
+
+    print(f"{'escenario':<18}{'ms':>10}{'llamadas':>10}{'MB storage':>12}{'pico MB':>10}")
+    for r in rows:
+        print(f"{r['scenario']:<18}{r['ms']:>10.1f}{r['storage_calls']:>10}{r['storage_mb']:>12.2f}"
+              f"{r['peak_mb']:>10.2f}" + (f"   ERROR {r['errors'][0]}" if r["errors"] else ""))
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": rows}, indent=2), "utf-8")
+
+
+if __name__ == "__main__":
+    main()
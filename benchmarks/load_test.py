@@ -0,0 +1,294 @@
+"""
+Prueba de carga con sesiones concurrentes: un curso entero abriendo la app
+contra un único proceso de Streamlit.
+
+Levanta `streamlit run APP.py` con el backend de Storage local
+(STORAGE_BACKEND="local", ver storage_local.py) sembrado con N objetos por
+bucket en cada tema, y abre S sesiones por WebSocket (/_stcore/stream), como
+lo haría el navegador. Cada sesión carga la página y luego, con una pausa de
+"lectura" entre acciones, cambia de tema con los botones de chips_grid o de
+sección con el selector de secciones. Al final informa:
+
+  - latencia de rerun p50/p95/máx (desde que la sesión manda el rerun hasta
+    script_finished), por tipo de acción
+  - llamadas a Storage por segundo (del METRICS_LOG de la app)
+  - memoria del proceso (RSS inicial, pico y final; Linux)
+
+  python benchmarks/load_test.py --sessions 40 --actions 15
+  python benchmarks/load_test.py --sessions 80 --ramp-s 60 --latency-ms 40 --json carga.json
+
+Requiere el paquete `websockets` (viene con las versiones de Streamlit que usan
+uvicorn; si no, `pip install websockets`).
+"""
+import argparse
+import ast
+import asyncio
+import json
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+import urllib.request
+from pathlib import Path
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.Radio_pb2 import Radio
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "APP.py"
+BUCKETS = {"resumenes": ".pdf", "apuntes": ".pdf", "videos": ".mp4", "audios": ".mp3"}
+# Desde 1.4x el radio viaja como texto de la opción; antes, como índice
+RADIO_AS_STRING = "raw_value" in Radio.DESCRIPTOR.fields_by_name
+
+
+def app_layout() -> tuple[list[str], str, callable]:
+    """TEMAS, COURSE_ROOT por defecto y safe_folder tal como están en APP.py (sin ejecutarla)."""
+    tree = ast.parse(APP.read_text("utf-8"))
+    temas, root, safe_folder = None, "Quimica_Organica", None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "TEMAS":
+            temas = ast.literal_eval(node.value)
+        elif isinstance(node, ast.FunctionDef) and node.name == "safe_folder":
+            ns = {"unicodedata": unicodedata, "re": re}
+            exec(compile(ast.Module([node], []), str(APP), "exec"), ns)
+            safe_folder = ns["safe_folder"]
+    return temas, root, safe_folder
+
+
+def seed_storage(root: Path, objects: int, kb: int):
+    temas, course_root, safe_folder = app_layout()
+    blob = b"x" * (kb * 1024)
+    for tema in temas:
+        for bucket, ext in BUCKETS.items():
+            folder = root / course_root / safe_folder(tema) / bucket
+            folder.mkdir(parents=True, exist_ok=True)
+            for i in range(objects):
+                (folder / f"archivo_{i:04d}{ext}").write_bytes(blob)
+    return temas
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float | None:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def start_server(args, work: Path) -> tuple[subprocess.Popen, str]:
+    secrets = work / "secrets.toml"
+    secrets.write_text("\n".join([
+        'STORAGE_BACKEND = "local"',
+        f'STORAGE_LOCAL_DIR = "{(work / "storage").as_posix()}"',
+        f"STORAGE_LATENCY_MS = {args.latency_ms}",
+        f'METRICS_LOG = "{(work / "metrics.jsonl").as_posix()}"',
+        f'DISK_CACHE_DIR = "{(work / "disk_cache").as_posix()}"',
+    ]) + "\n", "utf-8")
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", str(APP), "--server.headless", "true",
+         "--server.port", str(port), "--server.address", "127.0.0.1",
+         "--browser.gatherUsageStats", "false", "--server.fileWatcherType", "none",
+         "--secrets.files", str(secrets)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=open(work / "server.log", "wb"),
+    )
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(120):
+        try:
+            if urllib.request.urlopen(f"{base}/_stcore/health", timeout=1).status == 200:
+                return proc, base
+        except OSError:
+            time.sleep(0.5)
+        if proc.poll() is not None:
+            break
+    proc.kill()
+    raise RuntimeError(f"Streamlit no arrancó; ver {work / 'server.log'}")
+
+
+class Session:
+    """Un navegador simulado: manda reruns y junta los widgets de la página."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.buttons: dict[str, tuple[str, bool]] = {}  # label -> (id, disabled)
+        self.radio: Radio | None = None
+        self.page_hash = ""
+        self.errors: list[str] = []
+
+    async def rerun(self, widget=None, timeout: float = 120.0) -> float:
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_hash
+        if widget is not None:
+            msg.rerun_script.widget_states.widgets.append(widget)
+        t0 = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        while True:
+            fm = ForwardMsg()
+            fm.ParseFromString(await asyncio.wait_for(self.ws.recv(), timeout))
+            kind = fm.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = fm.new_session.page_script_hash
+                self.buttons, self.radio = {}, None
+            elif kind == "delta" and fm.delta.WhichOneof("type") == "new_element":
+                el = fm.delta.new_element
+                etype = el.WhichOneof("type")
+                if etype == "button":
+                    self.buttons[el.button.label] = (el.button.id, el.button.disabled)
+                elif etype == "radio":
+                    self.radio = el.radio
+                elif etype == "exception":
+                    self.errors.append(el.exception.message[:200])
+            elif kind == "script_finished" and fm.script_finished != fm.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - t0
+
+    def click(self, label: str):
+        w = BackMsg().rerun_script.widget_states.widgets.add()
+        w.id, w.trigger_value = self.buttons[label][0], True
+        return w
+
+    def choose_section(self, index: int):
+        w = BackMsg().rerun_script.widget_states.widgets.add()
+        w.id = self.radio.id
+        if RADIO_AS_STRING:
+            w.string_value = self.radio.options[index]
+        else:
+            w.int_value = index
+        return w
+
+
+async def run_session(n: int, args, ws_url: str, temas: list[str], results: list, rng: random.Random):
+    await asyncio.sleep(rng.uniform(0, args.ramp_s))
+    try:
+        async with websockets.connect(ws_url, subprotocols=["streamlit"], max_size=None,
+                                      open_timeout=60, ping_interval=None) as ws:
+            s = Session(ws)
+            results.append(("load", await s.rerun(), time.time()))
+            for _ in range(args.actions):
+                await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_s)
+                chips = [t for t in temas if t in s.buttons and not s.buttons[t][1]]
+                if s.radio is not None and (not chips or rng.random() < args.section_ratio):
+                    others = [i for i, _ in enumerate(s.radio.options)]
+                    results.append(("section", await s.rerun(s.choose_section(rng.choice(others))), time.time()))
+                elif chips:
+                    results.append(("topic", await s.rerun(s.click(rng.choice(chips))), time.time()))
+            for e in s.errors:
+                results.append(("error", e, time.time()))
+    except Exception as e:
+        results.append(("error", f"sesión {n}: {e!r}"[:200], time.time()))
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(p) - 1]
+
+
+async def sample_memory(pid: int, out: list, stop: asyncio.Event):
+    while not stop.is_set():
+        mb = rss_mb(pid)
+        if mb is not None:
+            out.append(mb)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(args, base: str, pid: int, temas: list[str]) -> tuple[list, list, float, float]:
+    ws_url = base.replace("http", "ws", 1) + "/_stcore/stream"
+    rng = random.Random(args.seed)
+    results, mem, stop = [], [], asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(pid, mem, stop))
+    t0 = time.time()
+    await asyncio.gather(*[run_session(i, args, ws_url, temas, results, random.Random(rng.random()))
+                           for i in range(args.sessions)])
+    t1 = time.time()
+    stop.set()
+    await sampler
+    return results, mem, t0, t1
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=30, help="sesiones simultáneas (alumnos)")
+    ap.add_argument("--actions", type=int, default=10, help="acciones por sesión después de cargar")
+    ap.add_argument("--ramp-s", type=float, default=10.0, help="las sesiones llegan repartidas en este lapso")
+    ap.add_argument("--think-s", type=float, default=1.0, help="pausa media entre acciones de una sesión")
+    ap.add_argument("--section-ratio", type=float, default=0.4, help="fracción de acciones que cambian de sección")
+    ap.add_argument("--objects", type=int, default=20, help="objetos por bucket en cada tema")
+    ap.add_argument("--object-kb", type=int, default=64)
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="latencia agregada a cada llamada a Storage")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="guardar los resultados en este archivo")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="carga_") as tmp:
+        work = Path(tmp)
+        temas = seed_storage(work / "storage", args.objects, args.object_kb)
+        proc, base = start_server(args, work)
+        try:
+            rss0 = rss_mb(proc.pid)
+            results, mem, t0, t1 = asyncio.run(drive(args, base, proc.pid, temas))
+            rss1 = rss_mb(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        calls = []
+        log = work / "metrics.jsonl"
+        if log.exists():
+            calls = [json.loads(line) for line in log.read_text("utf-8").splitlines() if line.strip()]
+
+    elapsed = t1 - t0
+    in_window = [c for c in calls if t0 <= c["ts"] <= t1]
+    by_kind: dict[str, list[float]] = {}
+    for kind, value, _ in results:
+        if kind != "error":
+            by_kind.setdefault(kind, []).append(value * 1000)
+    errors = [v for k, v, _ in results if k == "error"]
+    all_ms = [v for vs in by_kind.values() for v in vs]
+    report = {
+        "args": vars(args), "seconds": round(elapsed, 1), "reruns": len(all_ms),
+        "latency_ms": {k: {"n": len(v), "p50": round(pct(v, 50), 1), "p95": round(pct(v, 95), 1),
+                           "max": round(max(v), 1)} for k, v in {**by_kind, "todas": all_ms}.items() if v},
+        "storage_calls": len(in_window),
+        "storage_rps": round(len(in_window) / elapsed, 2) if elapsed else 0.0,
+        "storage_by_op": {op: sum(1 for c in in_window if c["op"] == op) for op in sorted({c["op"] for c in in_window})},
+        "memory_mb": {"start": rss0 and round(rss0, 1), "peak": mem and round(max(mem), 1),
+                      "end": rss1 and round(rss1, 1)},
+        "errors": errors[:20], "error_count": len(errors),
+    }
+
+    print(f"{args.sessions} sesiones, {report['reruns']} reruns en {elapsed:.1f} s "
+          f"(latencia Storage simulada {args.latency_ms:g} ms)")
+    print(f"{'acción':<10}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'máx ms':>10}")
+    for k, v in report["latency_ms"].items():
+        print(f"{k:<10}{v['n']:>6}{v['p50']:>10.1f}{v['p95']:>10.1f}{v['max']:>10.1f}")
+    print(f"Storage: {report['storage_calls']} llamadas, {report['storage_rps']} por segundo  {report['storage_by_op']}")
+    m = report["memory_mb"]
+    print(f"Memoria del proceso (MB): inicio {m['start']}, pico {m['peak']}, final {m['end']}")
+    if errors:
+        print(f"{len(errors)} errores; primero: {errors[0]}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), "utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Backend de Storage local para medir y probar APP.py sin un proyecto de Supabase.
+
+Imita la parte de storage3 que usa la app (from_(bucket).list/upload/update/
+remove/download/create_signed_urls, list_buckets y .session para los GET de
+objetos) y el endpoint TUS de subidas reanudables, todo sobre un
+httpx.MockTransport. Los objetos viven en memoria o en una carpeta local, y cada
+operación puede demorarse una latencia fija más el tiempo de transferencia a un
+ancho de banda dado.
+
+Se elige con el secret STORAGE_BACKEND = "memory" | "local" (ver get_storage en
+APP.py). STATS cuenta llamadas y bytes por operación para los benchmarks.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import mimetypes
+import threading
+import time
+import uuid
+from collections import Counter
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import unquote
+
+import httpx
+
+STATS = Counter()        # operación -> cantidad de llamadas
+STATS_BYTES = Counter()  # operación -> bytes transferidos
+_stats_lock = threading.Lock()
+
+def reset_stats():
+    with _stats_lock:
+        STATS.clear()
+        STATS_BYTES.clear()
+
+def _err(status: int, message: str) -> Exception:
+    # storage3 levanta StorageException con el dict del error como primer argumento
+    return Exception({"statusCode": status, "error": message, "message": message})
+
+
+class MemoryStore:
+    """path -> (bytes, content_type, mtime). Un dict por nombre, compartido en el proceso."""
+    _shared: dict[str, dict] = {}
+
+    def __init__(self, name: str = "default"):
+        self.objects = self._shared.setdefault(name, {})
+        self.lock = threading.Lock()
+
+    def get(self, path: str):
+        return self.objects.get(path)
+
+    def info(self, path: str):
+        obj = self.objects.get(path)
+        return (len(obj[0]), obj[1], obj[2]) if obj else None
+
+    def put(self, path: str, data: bytes, content_type: str):
+        with self.lock:
+            self.objects[path] = (data, content_type, time.time())
+
+    def delete(self, path: str) -> bool:
+        with self.lock:
+            return self.objects.pop(path, None) is not None
+
+    def paths(self) -> list[str]:
+        return list(self.objects)
+
+    def clear(self):
+        with self.lock:
+            self.objects.clear()
+
+
+class DirStore:
+    """Los objetos son archivos bajo root; el content-type sale de la extensión."""
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def get(self, path: str):
+        f = self.root / path
+        if not f.is_file():
+            return None
+        return (f.read_bytes(), mimetypes.guess_type(f.name)[0] or "application/octet-stream",
+                f.stat().st_mtime)
+
+    def info(self, path: str):
+        f = self.root / path
+        if not f.is_file():
+            return None
+        st_ = f.stat()
+        return st_.st_size, mimetypes.guess_type(f.name)[0] or "application/octet-stream", st_.st_mtime
+
+    def put(self, path: str, data: bytes, content_type: str):
+        f = self.root / path
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_name(f".{f.name}.{uuid.uuid4().hex}.part")
+        tmp.write_bytes(data)
+        tmp.replace(f)
+
+    def delete(self, path: str) -> bool:
+        f = self.root / path
+        if f.is_file():
+            f.unlink()
+            return True
+        return False
+
+    def paths(self) -> list[str]:
+        return [f.relative_to(self.root).as_posix() for f in self.root.rglob("*")
+                if f.is_file() and not f.name.endswith(".part")]
+
+    def clear(self):
+        for p in self.paths():
+            self.delete(p)
+
+
+class LocalBucket:
+    def __init__(self, client: "LocalStorageClient", name: str):
+        self.client, self.name = client, name
+
+    def list(self, path: str = "", options: dict | None = None) -> list[dict]:
+        self.client._charge("list")
+        prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+        entries = {}
+        for p in self.client.store.paths():
+            if not p.startswith(prefix):
+                continue
+            rest = p[len(prefix):]
+            if "/" in rest:  # subcarpeta: como Supabase, sin id ni metadata
+                folder = rest.split("/", 1)[0]
+                entries.setdefault(folder, {"name": folder, "id": None, "metadata": None})
+                continue
+            size, ct, mtime = self.client.store.info(p)
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(mtime))
+            entries[rest] = {"name": rest, "id": hashlib.md5(p.encode()).hexdigest(),
+                             "updated_at": stamp, "created_at": stamp,
+                             "metadata": {"size": size, "mimetype": ct}}
+        opts = options or {}
+        out = sorted(entries.values(), key=lambda e: e["name"],
+                     reverse=(opts.get("sortBy") or {}).get("order") == "desc")
+        offset, limit = int(opts.get("offset", 0)), int(opts.get("limit", 100))
+        return out[offset:offset + limit]
+
+    def _read(self, file) -> bytes:
+        if isinstance(file, (bytes, bytearray)):
+            return bytes(file)
+        if isinstance(file, (str, Path)):
+            return Path(file).read_bytes()
+        return file.read()
+
+    def upload(self, path: str, file, file_options: dict | None = None):
+        opts = {k.lower(): v for k, v in (file_options or {}).items()}
+        data = self._read(file)
+        self.client._charge("upload", len(data))
+        if self.client.store.get(path) is not None and opts.get("x-upsert") != "true":
+            raise _err(409, "The resource already exists")
+        self.client.store.put(path, data, opts.get("content-type", "application/octet-stream"))
+        return {"Key": f"{self.name}/{path}"}
+
+    def update(self, path: str, file, file_options: dict | None = None):
+        opts = {k.lower(): v for k, v in (file_options or {}).items()}
+        data = self._read(file)
+        self.client._charge("update", len(data))
+        self.client.store.put(path, data, opts.get("content-type", "application/octet-stream"))
+        return {"Key": f"{self.name}/{path}"}
+
+    def download(self, path: str, options: dict | None = None) -> bytes:
+        obj = self.client.store.get(path)
+        self.client._charge("download", len(obj[0]) if obj else 0)
+        if obj is None:
+            raise _err(404, "Object not found")
+        return obj[0]
+
+    def remove(self, paths: list[str]) -> list[dict]:
+        self.client._charge("remove")
+        return [{"name": p} for p in paths if self.client.store.delete(p)]
+
+    def create_signed_urls(self, paths: list[str], expires_in: int, options: dict | None = None):
+        self.client._charge("create_signed_urls")
+        return [{"path": p, "error": None,
+                 "signedURL": f"/object/sign/{self.name}/{p}?token={uuid.uuid4().hex[:16]}"}
+                for p in paths]
+
+    def get_public_url(self, path: str) -> str:
+        return f"{self.client.base_url}/object/public/{self.name}/{path}"
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+class LocalStorageClient:
+    """
+    Reemplazo de SyncStorageClient. root=None guarda en memoria; latency_ms se
+    suma a cada operación y mbps (si > 0) agrega el tiempo de transferencia.
+    """
+    def __init__(self, base_url: str, bucket: str = "utn", root: str | Path | None = None,
+                 latency_ms: float = 0.0, mbps: float = 0.0):
+        self.base_url = base_url.rstrip("/")
+        self.bucket = bucket
+        self.store = DirStore(root) if root else MemoryStore(bucket)
+        self.latency_s = latency_ms / 1000.0
+        self.bytes_per_s = mbps * 1024 * 1024 / 8 if mbps else 0.0
+        self._tus: dict[str, dict] = {}
+        self._tus_lock = threading.Lock()
+        self.transport = httpx.MockTransport(self._handle)
+        self.session = httpx.Client(base_url=f"{self.base_url}/", transport=self.transport)
+
+    def _charge(self, op: str, nbytes: int = 0):
+        with _stats_lock:
+            STATS[op] += 1
+            STATS_BYTES[op] += nbytes
+        delay = self.latency_s + (nbytes / self.bytes_per_s if self.bytes_per_s else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def from_(self, bucket: str) -> LocalBucket:
+        return LocalBucket(self, bucket)
+
+    def list_buckets(self) -> list[dict]:
+        self._charge("list_buckets")
+        return [{"name": self.bucket, "id": self.bucket, "public": True}]
+
+    # ---- HTTP: GET de objetos y endpoint TUS ----
+    def _handle(self, req: httpx.Request) -> httpx.Response:
+        path = unquote(req.url.path)
+        if "/upload/resumable" in path:
+            return self._handle_tus(req, path.split("/upload/resumable", 1)[1].strip("/"))
+        marker = f"/object/{self.bucket}/"
+        if req.method == "GET" and marker in path:
+            key = path.split(marker, 1)[1]
+            obj = self.store.get(key)
+            if obj is None:
+                self._charge("http_get")
+                return httpx.Response(404, json={"statusCode": "404", "error": "not_found"})
+            data, ct, mtime = obj
+            headers = {"ETag": _etag(data), "Last-Modified": formatdate(mtime, usegmt=True),
+                       "Content-Type": ct}
+            if req.headers.get("if-none-match") == headers["ETag"]:
+                self._charge("http_get")
+                return httpx.Response(304, headers=headers)
+            self._charge("http_get", len(data))
+            return httpx.Response(200, content=data, headers=headers)
+        return httpx.Response(404, json={"error": "unknown route"})
+
+    def _handle_tus(self, req: httpx.Request, upload_id: str) -> httpx.Response:
+        tus = {"Tus-Resumable": "1.0.0"}
+        if req.method == "POST":
+            self._charge("tus_create")
+            meta = {}
+            for pair in req.headers.get("upload-metadata", "").split(","):
+                if " " in pair.strip():
+                    k, v = pair.strip().split(" ", 1)
+                    meta[k] = base64.b64decode(v).decode()
+            upload_id = uuid.uuid4().hex
+            with self._tus_lock:
+                self._tus[upload_id] = {"length": int(req.headers["upload-length"]),
+                                        "object": meta.get("objectName", upload_id),
+                                        "type": meta.get("contentType", "application/octet-stream"),
+                                        "data": bytearray()}
+            return httpx.Response(201, headers={**tus, "Location": upload_id})
+        up = self._tus.get(upload_id)
+        if up is None:
+            return httpx.Response(404, headers=tus)
+        if req.method == "HEAD":
+            self._charge("tus_head")
+            return httpx.Response(200, headers={**tus, "Upload-Offset": str(len(up["data"])),
+                                                "Upload-Length": str(up["length"])})
+        if req.method == "PATCH":
+            body = req.read()
+            self._charge("tus_patch", len(body))
+            if int(req.headers.get("upload-offset", -1)) != len(up["data"]):
+                return httpx.Response(409, headers=tus)
+            up["data"] += body
+            if len(up["data"]) >= up["length"]:
+                self.store.put(up["object"], bytes(up["data"]), up["type"])
+                with self._tus_lock:
+                    self._tus.pop(upload_id, None)
+            return httpx.Response(204, headers={**tus, "Upload-Offset": str(len(up["data"]))})
+        return httpx.Response(405, headers=tus)
+
+
+def seed_json(client_or_store, path: str, obj) -> None:
+    """Atajo para sembrar un JSON (meta.json, manifest.json) en un store."""
+    store = getattr(client_or_store, "store", client_or_store)
+    store.put(path, json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json")